@@ -0,0 +1,141 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from biz.dqs_cache import is_history_period
+from framework.algorithm.embed_dis import distances
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+def fingerprint(text):
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    大模型回答的缓存，位于检索和生成之间。
+    键为 (模型及提示词版本, 单位, 数据日期, 检索内容及对话历史摘要, 规范化问题)：对话历史、检索到的数据和问题都相同时直接复用回答；
+    配置 answer_cache_similarity 时，检索内容相同、问题向量的余弦相似度不低于该值的换一种说法的问题也复用回答。
+    已结束周期的数据缓存 answer_cache_history_ttl 秒，当前周期缓存 answer_cache_current_ttl 秒；
+    更换模型或修改 answer_cache_version（提示词变化时）后原有缓存不再命中。
+    对话历史只记录大模型记忆窗口（memory_k 轮）内每轮问答的摘要，未启用缓存时不记录。
+    """
+
+    def __init__(self):
+        self.configs = SysConfig.get_config()
+        self.enable = bool(self.configs.get('answer_cache_enable', False))
+        self.max_size = int(self.configs.get('answer_cache_size', 1024))
+        self.similarity = float(self.configs.get('answer_cache_similarity', 0) or 0)
+        self.history_ttl = float(self.configs.get('answer_cache_history_ttl', 86400))
+        self.current_ttl = float(self.configs.get('answer_cache_current_ttl', 300))
+        self.history_turns = int(self.configs.get('memory_k', 3))
+        self.version = f"{self.configs.get('model_name', '')}:{self.configs.get('answer_cache_version', '1')}"
+        self._entries = OrderedDict()  # 键 -> (过期时间, 回答, 提示词, 问题向量)
+        self._groups = {}  # (版本, 单位, 数据日期, 检索内容摘要) -> 键集合
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def new_history(self):
+        """
+        :return: 一个连接的对话历史，未启用缓存时返回 None
+        """
+        return deque(maxlen=self.history_turns) if self.enable else None
+
+    @staticmethod
+    def remember(history, question, answer):
+        """
+        记录一轮问答的摘要，超出记忆窗口的轮次自动丢弃
+        """
+        if history is not None:
+            history.append(fingerprint(json.dumps([question, answer], ensure_ascii=False)))
+
+    def get(self, org_no, data_time, context, question, embedding=None, history=()):
+        """
+        :param history: new_history() 返回的本次对话之前的历史，历史不同时回答可能不同
+        :return: (answer, prompt)，未命中时返回 None
+        """
+        if not self.enable:
+            return None
+        group = self._group(org_no, data_time, context, history)
+        key = group + (' '.join(str(question).split()),)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            if self.similarity > 0 and embedding is not None:
+                similar = self._similar(group, embedding, now)
+                if similar is not None:
+                    self._entries.move_to_end(similar)
+                    self.similar_hits += 1
+                    entry = self._entries[similar]
+                    return entry[1], entry[2]
+            self.misses += 1
+        return None
+
+    def put(self, org_no, data_time, context, question, answer, prompt, embedding=None, history=()):
+        if not self.enable or not answer:
+            return
+        group = self._group(org_no, data_time, context, history)
+        key = group + (' '.join(str(question).split()),)
+        ttl = self.history_ttl if is_history_period(data_time) else self.current_ttl
+        vector = None if embedding is None else np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, answer, prompt, vector)
+            self._entries.move_to_end(key)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.similar_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.similar_hits) / requests if requests else 0.0,
+            }
+
+    def _group(self, org_no, data_time, context, history=()):
+        if history:
+            # 历史中是每轮问答的摘要，不需要重新序列化全部对话
+            context = '\n'.join([str(context), *history])
+        return self.version, org_no or '', data_time or '', fingerprint(context)
+
+    def _similar(self, group, embedding, now):
+        # 调用方持有锁
+        keys = [
+            key for key in self._groups.get(group, ())
+            if self._entries[key][0] > now and self._entries[key][3] is not None
+        ]
+        if not keys:
+            return None
+        scores = distances(embedding, np.stack([self._entries[key][3] for key in keys]), 'cosine')
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def _discard(self, key):
+        # 调用方持有锁
+        self._entries.pop(key, None)
+        group = key[:-1]
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+
+answer_cache = AnswerCache()
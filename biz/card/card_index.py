@@ -0,0 +1,309 @@
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from framework.algorithm.bm25_index import BM25Index
+from framework.algorithm.jionlp_data_collect import jio_parse_time_point
+from framework.algorithm.vector_index import VectorIndex
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+def parse_vector(value):
+    # 未注册 pgvector 类型时 psycopg2 返回 '[0.1,0.2,...]' 字符串
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+class CardIndex:
+    """
+    miop_module_embedding 卡片表的进程内索引。
+    首次使用时全量加载，之后按 card_index_refresh_interval 秒检查表的水位（行数、最大vector_id），
+    只有新增行时增量加载，行数与新增行数对不上（有删除）时全量重建。
+    修改已有卡片的描述或向量不改变水位，不会被自动发现，修改后需通过 reload（POST /card/reload）显式重建。
+
+    card_vector_backend 为 local 时同时维护卡片向量的进程内副本（VectorIndex），按水位保存到 card_vector_path 目录，
+    同一主机上的多个 uvicorn worker 以内存映射方式只读共享同一份快照，先加载的 worker 负责从数据库读取向量。
+    此时还按 miop_module_datas 维护每个单位可用卡片在向量矩阵中的行下标，检索时只在本单位的行中取 top_k。
+
+    卡片描述中的日期在加载后由后台线程预先解析（直接调用 jionlp，不占用问题解析的 time_parser 缓存），
+    新增卡片在首次用到时解析；相对时间按当天解析，跨天后由后台线程重新解析全部卡片。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.configs = SysConfig.get_config()
+        self.refresh_interval = float(self.configs.get('card_index_refresh_interval', 60))
+        self.vector_enable = self.configs.get('card_vector_backend', 'pgvector') == 'local'
+        # float16 减半内存，但量化后的粗排可能漏掉真正的近邻、平均距离也有偏移，需显式配置
+        self.vector_dtype = self.configs.get('card_vector_dtype', 'float32')
+        self.vector_path = self.configs.get('card_vector_path', 'resources/datas/card_vectors')
+        self.bm25 = BM25Index()
+        self.vectors = VectorIndex(self.vector_dtype)
+        self.descs = {}  # vector_id -> api_desc
+        self.org_ids = {}  # org_no -> 该单位的 vector_id 数组
+        self._org_rows = (None, {})  # (计算时的 VectorIndex, org_no -> 行下标)
+        self._desc_dates = ('', {})  # (解析日期, api_desc -> 卡片日期)
+        self._dates_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._watermark = None  # (行数, 最大vector_id)
+        self._org_watermark = None
+        self._checked_at = 0.0
+
+    def get_watermark(self):
+        result = self.db.query(
+            "SELECT COUNT(*) AS total, MAX(vector_id::bigint) AS max_id FROM miop_module_embedding"
+        )
+        return int(result[0]['total']), int(result[0]['max_id'] or 0)
+
+    def get_org_watermark(self):
+        result = self.db.query(
+            "SELECT COUNT(*) AS total, SUM(vector_id::bigint) AS id_sum FROM miop_module_datas"
+        )
+        return int(result[0]['total']), int(result[0]['id_sum'] or 0)
+
+    def reload(self):
+        """
+        全量重建索引
+        """
+        with self._lock:
+            self._reload(self.get_watermark(), force=True)
+        return len(self.bm25)
+
+    def refresh(self, force=False):
+        """
+        检查水位，按需增量或全量刷新索引
+        """
+        if not force and self._watermark is not None and time.time() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and self._watermark is not None and time.time() - self._checked_at < self.refresh_interval:
+                return
+            watermark = self.get_watermark()
+            self._checked_at = time.time()
+            if self.vector_enable and self._watermark is not None:
+                self._refresh_orgs()
+            if watermark == self._watermark:
+                return
+            if self._watermark is None or watermark[1] <= self._watermark[1]:
+                self._reload(watermark)
+                return
+
+            docs = self._load_docs(self._watermark[1])
+            if self._watermark[0] + len(docs) != watermark[0]:
+                # 除新增外还有删除，全量重建
+                self._reload(watermark)
+                return
+            self._apply(docs, incremental=True)
+            if self.vector_enable:
+                self._append_vectors(watermark, self._watermark[1])
+            self._watermark = watermark
+            logger.info("Card index appended %s rows, watermark: %s", len(docs), watermark)
+
+    def bm25_query(self, search_text, top_k):
+        """
+        :return: [(vector_id, api_desc), ...]
+        """
+        self.refresh()
+        return self.bm25.query(search_text, top_k)
+
+    def vector_query(self, embedding, top_k, org_no=None):
+        """
+        与 pgvector 的 ORDER BY embedding <-> query LIMIT top_k 等价的进程内检索
+
+        :param org_no: 单位编码，指定时只在该单位的卡片中检索
+        :return: [(vector_id, distance, api_desc), ...]，按L2距离升序
+        """
+        self.refresh()
+        rows = None if org_no is None else self.org_rows(org_no)
+        ids, distances = self.vectors.search(embedding, top_k, rows)
+        return [
+            (int(vector_id), float(distance), self.descs.get(int(vector_id), ''))
+            for vector_id, distance in zip(ids, distances)
+        ]
+
+    def desc_date(self, api_desc):
+        """
+        :return: 卡片描述中解析出的日期 yyyymmdd，没有日期时返回 None
+        """
+        dates = self._today_dates()
+        if api_desc not in dates:
+            parse_time = jio_parse_time_point(api_desc)
+            dates[api_desc] = parse_time[0] if parse_time and parse_time[0] else None
+        return dates[api_desc]
+
+    def _today_dates(self):
+        """
+        :return: 当天的 api_desc -> 卡片日期，跨天时换成新的映射并在后台重新解析全部卡片
+        """
+        today = time.strftime('%Y%m%d')
+        parsed_day, dates = self._desc_dates
+        if parsed_day == today:
+            return dates
+        with self._dates_lock:
+            parsed_day, dates = self._desc_dates
+            if parsed_day == today:
+                return dates
+            first = not parsed_day
+            dates = {}
+            self._desc_dates = (today, dates)
+        if not first:
+            self._parse_dates(list(self.descs.values()))
+        return dates
+
+    def org_rows(self, org_no):
+        """
+        :return: 单位可用卡片在当前向量矩阵中的行下标，向量或单位数据变化后重新计算
+        """
+        vectors = self.vectors
+        computed_for, org_rows = self._org_rows
+        if computed_for is not vectors:
+            org_rows = {}
+            self._org_rows = (vectors, org_rows)
+        rows = org_rows.get(org_no)
+        if rows is None:
+            rows = vectors.rows_of(self.org_ids.get(org_no, ()))
+            org_rows[org_no] = rows
+        return rows
+
+    def _reload(self, watermark, force=False):
+        start = time.time()
+        docs = self._load_docs()
+        self._apply(docs, incremental=False)
+        if self.vector_enable:
+            self._load_vectors(watermark, force)
+            self._load_orgs(self.get_org_watermark())
+        self._watermark = watermark
+        self._checked_at = time.time()
+        logger.info(
+            "Card index reloaded %s rows in %.3fs, watermark: %s", len(docs), time.time() - start, watermark
+        )
+
+    def _load_docs(self, after_id=None):
+        """
+        :return: [(vector_id, api_desc), ...]，逐行构建，不保留完整的行对象
+        """
+        if after_id is None:
+            rows = self.db.query_stream("SELECT vector_id, api_desc FROM miop_module_embedding")
+        else:
+            rows = self.db.query_stream(
+                "SELECT vector_id, api_desc FROM miop_module_embedding WHERE vector_id::bigint > %s",
+                (after_id,),
+            )
+        return [(int(row.vector_id), row.api_desc) for row in rows]
+
+    def _apply(self, docs, incremental):
+        if incremental:
+            self.bm25.add(docs)
+            self.descs.update(docs)
+        else:
+            # 在新实例上构建后整体替换，重建期间查询仍使用旧索引
+            bm25 = BM25Index()
+            bm25.build(docs)
+            self.bm25 = bm25
+            self.descs = dict(docs)
+        self._parse_dates([api_desc for _, api_desc in docs])
+
+    def _parse_dates(self, descs):
+        def parse():
+            start = time.time()
+            for api_desc in set(descs):
+                try:
+                    self.desc_date(api_desc)
+                except Exception as e:
+                    logger.warning("Failed to parse card date of %s: %s", api_desc, e)
+            logger.info("Card dates parsed for %s descs in %.3fs", len(descs), time.time() - start)
+
+        if descs:
+            threading.Thread(target=parse, name='card-desc-dates', daemon=True).start()
+
+    def _refresh_orgs(self):
+        org_watermark = self.get_org_watermark()
+        if org_watermark != self._org_watermark:
+            self._load_orgs(org_watermark)
+
+    def _load_orgs(self, org_watermark):
+        org_ids = {}
+        for row in self.db.query_stream("SELECT org_no, vector_id FROM miop_module_datas"):
+            org_ids.setdefault(row.org_no, []).append(int(row.vector_id))
+        self.org_ids = {org_no: np.unique(np.asarray(ids, dtype=np.int64)) for org_no, ids in org_ids.items()}
+        self._org_rows = (None, {})
+        self._org_watermark = org_watermark
+        logger.info("Card org index loaded %s orgs, watermark: %s", len(self.org_ids), org_watermark)
+
+    def _snapshot_path(self, watermark):
+        # 路径包含存储精度，修改 card_vector_dtype 后不会加载另一精度的快照
+        return os.path.join(self.vector_path, f'card_vectors_{self.vector_dtype}_{watermark[0]}_{watermark[1]}')
+
+    def _load_vectors(self, watermark, force):
+        if not force and self._load_snapshot(watermark):
+            return
+        ids, vectors = self._fetch_vectors()
+        self._save_vectors(watermark, VectorIndex(self.vector_dtype).build(ids, vectors))
+
+    def _append_vectors(self, watermark, after_id):
+        if self._load_snapshot(watermark):
+            return
+        ids, vectors = self._fetch_vectors(after_id)
+        vector_index = VectorIndex(self.vector_dtype).build(self.vectors.ids, self.vectors.matrix)
+        self._save_vectors(watermark, vector_index.append(ids, vectors))
+
+    def _load_snapshot(self, watermark):
+        """
+        加载其他 worker 已保存的相同水位的快照，快照不存在或刚被删除时返回False
+        """
+        path = self._snapshot_path(watermark)
+        if not VectorIndex.exists(path):
+            return False
+        try:
+            self.vectors = VectorIndex.load(path)
+            return True
+        except OSError as e:
+            logger.warning("Failed to load card vector snapshot %s: %s", path, e)
+            return False
+
+    def _fetch_vectors(self, after_id=None):
+        # 按 vector_id 排序，增量追加的向量总在已有向量之后，各 worker 构建的快照行顺序一致
+        sql = "SELECT vector_id, embedding FROM miop_module_embedding"
+        order = " ORDER BY vector_id::bigint"
+        rows = (
+            self.db.query_stream(sql + order)
+            if after_id is None
+            else self.db.query_stream(sql + " WHERE vector_id::bigint > %s" + order, (after_id,))
+        )
+        ids, vectors = [], []
+        for row in rows:
+            ids.append(int(row.vector_id))
+            vectors.append(parse_vector(row.embedding))
+        return ids, vectors
+
+    def _save_vectors(self, watermark, vector_index):
+        path = self._snapshot_path(watermark)
+        try:
+            os.makedirs(self.vector_path, exist_ok=True)
+            vector_index.save(path)
+            self.vectors = VectorIndex.load(path)
+        except OSError as e:
+            logger.warning("Failed to save card vector snapshot, using in-memory vectors: %s", e)
+            self.vectors = vector_index
+            return
+        # 只删除比刚写入的快照更早的其他快照，其他 worker 之后写入的新快照保留；已映射旧文件的 worker 不受影响
+        try:
+            saved_at = os.path.getmtime(path + '.json')
+        except OSError:
+            return
+        for file in glob.glob(os.path.join(self.vector_path, 'card_vectors_*')):
+            if file.startswith(path + '.'):
+                continue
+            try:
+                if os.path.getmtime(file) < saved_at:
+                    os.remove(file)
+            except OSError:
+                pass
@@ -1,13 +1,55 @@
-from framework.algorithm.lcs_finder import longest_common_subsequence, longest_common_substring
-from framework.algorithm.simple_bm25 import SimpleBM25
-from framework.embedding.m3e_client import m3e_client
+from biz.card.card_index import CardIndex
+from framework.algorithm.lcs_scorer import LCSScorer
+from framework.embedding.embedding_cache import cached_m3e_client
 from transport.db.postgresdb import PostgresDB
 from utils.config_utils import SysConfig
 from utils.logger_utils import LoggerFactory
 
 pgdb = PostgresDB('postgres_qin')
+card_index = CardIndex(pgdb)
 logger = LoggerFactory.get_logger(__name__)
 
+# 一次往返完成卡片检索：向量近邻 + BM25候选，关联本单位的模块数据，再按主编码取卡片描述
+# 查询向量只绑定一次，ORDER BY 使用输出列 distance，仍可走 pgvector 索引
+# 近邻检索时即限定为本单位有模块数据的卡片，每个单位都能取满 top_k，不会在关联后被过滤掉
+CARD_SEARCH_SQL = """
+    WITH ann AS (
+        SELECT e.vector_id::bigint AS vector_id, e.api_desc, e.embedding <-> %(embedding)s::vector AS distance
+        FROM miop_module_embedding e
+        WHERE EXISTS (
+            SELECT 1 FROM miop_module_datas od
+            WHERE od.vector_id = e.vector_id::bigint AND od.org_no = %(org_no)s
+        )
+        ORDER BY distance LIMIT %(top_k)s
+    ),
+    candidates AS (
+        SELECT vector_id, api_desc, distance FROM ann
+        UNION ALL
+        SELECT b.vector_id, NULL, NULL FROM unnest(%(bm25_ids)s::bigint[]) AS b(vector_id)
+        WHERE b.vector_id NOT IN (SELECT vector_id FROM ann)
+    )
+    SELECT c.vector_id, c.api_desc, c.distance, d.module_description, d.api_code,
+           m.api_code AS card_api_code, m.api_desc AS card_api_desc
+    FROM candidates c
+    LEFT JOIN miop_module_datas d ON d.vector_id = c.vector_id AND d.org_no = %(org_no)s
+    LEFT JOIN LATERAL (
+        SELECT api_code, api_desc FROM miop_module_embedding
+        WHERE api_code = split_part(d.api_code, '.', 1) LIMIT 1
+    ) m ON TRUE
+"""
+
+# 向量近邻已在进程内检索时（card_vector_backend: local），只需按候选ID关联本单位的模块数据和卡片描述
+CARD_DATA_SQL = """
+    SELECT d.vector_id, d.module_description, d.api_code,
+           m.api_code AS card_api_code, m.api_desc AS card_api_desc
+    FROM miop_module_datas d
+    LEFT JOIN LATERAL (
+        SELECT api_code, api_desc FROM miop_module_embedding
+        WHERE api_code = split_part(d.api_code, '.', 1) LIMIT 1
+    ) m ON TRUE
+    WHERE d.vector_id = ANY(%(ids)s::bigint[]) AND d.org_no = %(org_no)s
+"""
+
 
 def fetch_main_code(api_code):
     if '.' not in api_code:
@@ -59,12 +101,10 @@ def find_best_matches(tuples_list, query_string):
     """
     matches_info = []
 
-    # 计算每个元组的最长公共子序列和最长公共子串长度
+    # 计算每个元组的最长公共子序列和最长公共子串长度，查询串只预处理一次
+    scorer = LCSScorer(query_string)
     for key, string in tuples_list:
-        lcs = longest_common_subsequence(string, query_string)
-        lcsstr = longest_common_substring(string, query_string)
-        lcs_length = len(lcs)
-        lcsstr_length = len(lcsstr)
+        lcs_length, lcsstr_length = scorer.score(string)
         matches_info.append((string, key, lcs_length, lcsstr_length))
 
     # 根据最长公共子序列长度和最长公共子串长度排序
@@ -79,12 +119,20 @@ class EmbeddingService:
     def __init__(self):
         self.configs = SysConfig.get_config()
         self.base_org_no = self.configs['test_org_no']
-        self.embedding_client = m3e_client
-        self.bm25 = SimpleBM25()
+        self.embedding_client = cached_m3e_client
         self.top_k = self.configs['top_k']
-        self.prompt_top_k = self.get('prompt_top_k', 1)
+        self.prompt_top_k = self.configs.get('prompt_top_k', 1)
+
+    def get_embedding(self, search_text):
+        embedding_response = self.embedding_client.get_embeddings(
+            [search_text], self.configs['m3e_model_name']
+        )
+        return embedding_response['data'][0]['embedding'] if embedding_response else None
 
-    def get_similar_vector_ids(self, search_text):
+    def get_similar_vector_ids(self, search_text, org_no=None):
+        """
+        :param org_no: 单位编码，指定时只在该单位有模块数据的卡片中检索
+        """
         logger.info("Getting similar vector ids for search text: %s", search_text)
         try:
             embedding_response = self.embedding_client.get_embeddings(
@@ -93,20 +141,32 @@ class EmbeddingService:
             if embedding_response:
                 embedding = embedding_response['data'][0]['embedding']
 
+                if card_index.vector_enable:
+                    # 进程内向量副本，结果与下面的 pgvector 查询一致
+                    vector_ids_distances = card_index.vector_query(embedding, self.top_k, org_no)
+                    logger.info("Found similar vector ids: %s", vector_ids_distances)
+                    return vector_ids_distances
+
                 # 查询欧式距离 (L2) 最近的向量
-                sql = """
-                    SELECT vector_id, api_desc, embedding <-> %s::vector AS distance 
-                    FROM miop_module_embedding 
-                    ORDER BY embedding <-> %s::vector LIMIT %s
-                """
-                results = pgdb.query(
-                    sql,
-                    (
-                        embedding,
-                        embedding,
-                        self.top_k,
-                    ),
-                )
+                if org_no is None:
+                    sql = """
+                        SELECT vector_id, api_desc, embedding <-> %s::vector AS distance 
+                        FROM miop_module_embedding 
+                        ORDER BY embedding <-> %s::vector LIMIT %s
+                    """
+                    parameters = (embedding, embedding, self.top_k)
+                else:
+                    sql = """
+                        SELECT e.vector_id, e.api_desc, e.embedding <-> %s::vector AS distance 
+                        FROM miop_module_embedding e 
+                        WHERE EXISTS (
+                            SELECT 1 FROM miop_module_datas d
+                            WHERE d.vector_id = e.vector_id::bigint AND d.org_no = %s
+                        )
+                        ORDER BY e.embedding <-> %s::vector LIMIT %s
+                    """
+                    parameters = (embedding, org_no, embedding, self.top_k)
+                results = pgdb.query(sql, parameters)
 
                 vector_ids_distances = [
                     (result['vector_id'], result['distance'], result['api_desc'])
@@ -122,11 +182,12 @@ class EmbeddingService:
 
     @staticmethod
     def get_all_desc():
-        results = pgdb.query("SELECT vector_id, api_desc FROM miop_module_embedding")
-        return [(result['vector_id'], result['api_desc']) for result in results]
+        results = pgdb.query_stream("SELECT vector_id, api_desc FROM miop_module_embedding")
+        return [(result.vector_id, result.api_desc) for result in results]
 
     def get_bm25_top_ids(self, search_text):
-        top_k = self.bm25.query(self.get_all_desc(), search_text, self.top_k, 1)
+        # 使用常驻内存的BM25索引，不再每次全表读取
+        top_k = card_index.bm25_query(search_text, self.top_k)
         logger.info("Found similar bm25 ids: %s", top_k)
         return top_k
 
@@ -155,9 +216,78 @@ class EmbeddingService:
             logger.error("An error occurred while fetching search results: %s", e, exc_info=True)
             raise e
 
+    def card_search(self, search_text, org_no, embedding=None):
+        """
+        一次数据库往返完成卡片检索，结果与 vector_search + get_api_code 一致
+
+        :param embedding: 调用方已取得的问题嵌入向量，不传时在此请求
+        :return: (prompt_result, api_code, api_desc)
+        """
+        if embedding is None:
+            embedding = self.get_embedding(search_text)
+        if embedding is None:
+            return [], '', ''
+
+        bm25 = self.get_bm25_top_ids(search_text)
+        bm25_vector_ids = [int(vector_id) for vector_id, _ in bm25]
+        try:
+            if card_index.vector_enable:
+                ids_distances = card_index.vector_query(embedding, self.top_k, org_no)
+                candidate_ids = list(
+                    dict.fromkeys([vector_id for vector_id, _, _ in ids_distances] + bm25_vector_ids)
+                )
+                rows = pgdb.query(CARD_DATA_SQL, {'ids': candidate_ids, 'org_no': org_no})
+            else:
+                rows = pgdb.query(
+                    CARD_SEARCH_SQL,
+                    {
+                        'embedding': embedding,
+                        'top_k': self.top_k,
+                        'bm25_ids': bm25_vector_ids,
+                        'org_no': org_no,
+                    },
+                )
+                ids_distances = list(
+                    {row['vector_id']: (row['vector_id'], row['distance'], row['api_desc'])
+                     for row in rows if row['distance'] is not None}.values()
+                )
+        except Exception as e:
+            logger.error("An error occurred while searching cards: %s", e, exc_info=True)
+            raise e
+
+        if not ids_distances:
+            return [], '', ''
+        avg_distance = calculate_average_distance(ids_distances)
+        logger.info(f"avg distance: {avg_distance}")
+        if self.configs['card_distance_threshold'] < avg_distance:
+            return [], '', ''
+
+        ids_int = [(int(vector_id), api_desc) for vector_id, distance, api_desc in ids_distances]
+        bm25_ids = [(int(vector_id), api_desc) for vector_id, api_desc in bm25]
+        ids_int = list(set(ids_int).union(set(bm25_ids)))
+
+        sorted_results = find_best_matches(ids_int, search_text)
+        logger.info("sorted result: %s", sorted_results)
+        results_dict = {
+            row['vector_id']: row for row in rows if row['api_code'] is not None
+        }
+        search_results = [
+            results_dict[vector_id] for vector_id, _ in sorted_results if vector_id in results_dict
+        ]
+        prompt_result = [
+            (row['module_description'], row['api_code']) for row in search_results[: self.prompt_top_k]
+        ]
+        if not prompt_result:
+            return [], '', ''
+
+        first = search_results[0]
+        api_code = first['card_api_code'] or fetch_main_code(first['api_code'])
+        api_desc = first['card_api_desc'] or ''
+        return prompt_result, api_code, api_desc
+
     def vector_search(self, search_text, org_no):
         # 获取相似的向量ID和它们的距离
-        ids_distances = self.get_similar_vector_ids(search_text)
+        ids_distances = self.get_similar_vector_ids(search_text, org_no)
         avg_distance = calculate_average_distance(ids_distances)
         logger.info(f"avg distance: {avg_distance}")
         if self.configs['card_distance_threshold'] < avg_distance:
@@ -0,0 +1,301 @@
+import atexit
+import datetime
+import fcntl
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+COLUMNS = (
+    'session_code',
+    'question',
+    'api_code',
+    'answer',
+    'org_no',
+    'rating',
+    'vector_duration',
+    'llm_duration',
+    'timestamp',
+)
+
+ORACLE_INSERT_SQL = (
+    "INSERT INTO AI_CHAT_RECORDS (ID, SESSION_CODE, QUESTION, API_CODE, ANSWER, ORG_NO, RATING, "
+    "VECTOR_DURATION, LLM_DURATION, TIMESTAMP) "
+    "VALUES (SEQ_AI_CHAT_RECORDS.NEXTVAL, :1, :2, :3, :4, :5, :6, :7, :8, :9)"
+)
+POSTGRES_INSERT_SQL = (
+    'INSERT INTO ai_chat_records (session_code, question, api_code, answer, org_no, rating, '
+    'vector_duration, llm_duration, "timestamp") VALUES '
+)
+
+# 单条写入失败后用于区分数据库不可用和记录被拒绝
+ORACLE_PING_SQL = "SELECT 1 FROM DUAL"
+POSTGRES_PING_SQL = "SELECT 1"
+
+# Oracle VARCHAR2(4000) 按字节计算长度
+ORACLE_VARCHAR_BYTES = 4000
+
+
+def truncate_bytes(text, max_bytes):
+    if text is None:
+        return None
+    data = str(text).encode('utf-8')
+    if len(data) <= max_bytes:
+        return str(text)
+    return data[:max_bytes].decode('utf-8', errors='ignore')
+
+
+def create_db(db_name):
+    if db_name.startswith('oracle'):
+        from transport.db.oracledb import OracleDB
+
+        return OracleDB(db_name)
+    from transport.db.postgresdb import PostgresDB
+
+    return PostgresDB(db_name)
+
+
+class ChatRecordWriter:
+    """
+    对话记录的后台批量写入。
+    add_chat_record 只把记录放入队列，后台线程在攒够 chat_record_batch_size 条或每隔
+    chat_record_flush_interval 秒时批量写入 chat_record_dbs 中的各个数据库（并发写入）：
+    Postgres 使用多行 INSERT，Oracle 使用数组DML。
+    写入失败的记录追加到本地 spool 文件（每个数据库一个 jsonl 文件），之后的刷新周期中重放，记录不会丢失。
+    批量写入失败时逐条重试：数据库可用但仍被拒绝的记录（如 Oracle 中为空的非空列）转入死信文件，
+    不再重放，避免一条坏记录阻塞整个 spool。进程异常退出时留下的不完整行无法解析，转入 .corrupt 文件。
+    多个 worker 进程共用 spool 文件，通过文件锁互斥。
+    """
+
+    def __init__(self):
+        self.configs = SysConfig.get_config()
+        db_names = self.configs.get('chat_record_dbs') or []
+        if isinstance(db_names, str):
+            db_names = [name.strip() for name in db_names.split(',') if name.strip()]
+        self.db_names = db_names
+        self.batch_size = int(self.configs.get('chat_record_batch_size', 50))
+        self.flush_interval = float(self.configs.get('chat_record_flush_interval', 2))
+        self.spool_dir = self.configs.get('chat_record_spool_dir', 'logs/chat_record_spool')
+        self._dbs = {}
+        self._queue = queue.Queue()
+        self._full = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self.db_names), 1), thread_name_prefix='chat-record'
+        )
+
+    def add_chat_record(
+        self, session_code, question, api_code, answer, org_no, vector_duration, llm_duration, rating
+    ):
+        self._ensure_worker()
+        self._queue.put(
+            {
+                'session_code': session_code,
+                'question': question,
+                'api_code': api_code,
+                'answer': answer,
+                'org_no': org_no,
+                'rating': rating,
+                'vector_duration': vector_duration,
+                'llm_duration': llm_duration,
+                'timestamp': datetime.datetime.now().isoformat(),
+            }
+        )
+        if self._queue.qsize() >= self.batch_size:
+            self._full.set()
+
+    def flush(self, concurrent=True):
+        """
+        写入队列中的全部记录并重放spool文件
+
+        :param concurrent: 是否并发写入各个数据库，进程退出时线程池已关闭，需要逐个写入
+        """
+        with self._flush_lock:
+            records = []
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not concurrent:
+                for db_name in self.db_names:
+                    self._write_db(db_name, records)
+                return
+            futures = [
+                self._executor.submit(self._write_db, db_name, records) for db_name in self.db_names
+            ]
+            for future in futures:
+                future.result()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name='chat-record-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, concurrent=False)
+
+    def _run(self):
+        while True:
+            # 攒够一批或到达刷新间隔时写入
+            self._full.wait(self.flush_interval)
+            self._full.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Chat record writer error: %s", e, exc_info=True)
+
+    def _write_db(self, db_name, records):
+        with open(os.path.join(self.spool_dir, f'{db_name}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._write_spooled(db_name, records)
+            except Exception as e:
+                # 本批记录已从队列中取出，出错时放回spool，之后的刷新周期中重放
+                logger.error("Failed to write chat records to %s, spooling them: %s", db_name, e, exc_info=True)
+                self._spool(os.path.join(self.spool_dir, f'{db_name}.jsonl'), records)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_spooled(self, db_name, records):
+        spool_file = os.path.join(self.spool_dir, f'{db_name}.jsonl')
+        replay_file = spool_file + '.replay'
+
+        # 先重放之前写入失败的记录，重放失败时本批记录直接进入spool，保持写入顺序
+        if not os.path.exists(replay_file) and os.path.exists(spool_file):
+            os.replace(spool_file, replay_file)
+        if os.path.exists(replay_file):
+            spooled = self._read_spool(db_name, replay_file)
+            pending = self._write_all(db_name, spooled)
+            if pending:
+                self._rewrite(replay_file, pending)
+                self._spool(spool_file, records)
+                return
+            os.remove(replay_file)
+            logger.info("Replayed %s chat records to %s", len(spooled), db_name)
+
+        self._spool(spool_file, self._write_all(db_name, records))
+
+    def _read_spool(self, db_name, spool_file):
+        """
+        读取spool文件，无法解析的行（进程在追加时退出留下的不完整行）转入 .corrupt 文件
+        """
+        records, corrupt = [], []
+        with open(spool_file, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    corrupt.append(line if line.endswith('\n') else line + '\n')
+        if corrupt:
+            logger.warning("Moved %s unreadable spooled chat records of %s to corrupt file", len(corrupt), db_name)
+            with open(os.path.join(self.spool_dir, f'{db_name}.corrupt'), 'a', encoding='utf-8') as f:
+                f.writelines(corrupt)
+        return records
+
+    def _write_all(self, db_name, records):
+        """
+        按批写入，返回未能写入的记录
+        """
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i: i + self.batch_size]
+            try:
+                self._insert(db_name, batch)
+            except Exception as e:
+                logger.warning("Failed to write chat records to %s, retrying one by one: %s", db_name, e)
+                self._dbs.pop(db_name, None)
+                pending = self._write_each(db_name, batch)
+                if pending:
+                    pending += records[i + self.batch_size:]
+                    logger.warning("%s unavailable, spooled %s chat records", db_name, len(pending))
+                    return pending
+        return []
+
+    def _write_each(self, db_name, records):
+        """
+        逐条写入，返回数据库不可用时未能写入的记录；数据库可用但被拒绝的记录转入死信文件
+        """
+        for i, record in enumerate(records):
+            try:
+                self._insert(db_name, [record])
+            except Exception as e:
+                self._dbs.pop(db_name, None)
+                if not self._reachable(db_name):
+                    return records[i:]
+                logger.error("Chat record rejected by %s, moved to dead letter file: %s", db_name, e)
+                self._spool(os.path.join(self.spool_dir, f'{db_name}.dead.jsonl'), [record])
+        return []
+
+    def _reachable(self, db_name):
+        try:
+            db = self._dbs.get(db_name)
+            if db is None:
+                db = self._dbs[db_name] = create_db(db_name)
+            db.query(ORACLE_PING_SQL if db_name.startswith('oracle') else POSTGRES_PING_SQL)
+            return True
+        except Exception:
+            self._dbs.pop(db_name, None)
+            return False
+
+    def _insert(self, db_name, records):
+        db = self._dbs.get(db_name)
+        if db is None:
+            db = self._dbs[db_name] = create_db(db_name)
+
+        rows = [
+            tuple(
+                datetime.datetime.fromisoformat(record['timestamp']) if column == 'timestamp'
+                else record[column]
+                for column in COLUMNS
+            )
+            for record in records
+        ]
+        if db_name.startswith('oracle'):
+            rows = [
+                tuple(
+                    truncate_bytes(value, ORACLE_VARCHAR_BYTES) if isinstance(value, str) else value
+                    for value in row
+                )
+                for row in rows
+            ]
+            db.execute_many(ORACLE_INSERT_SQL, rows)
+        else:
+            values = ', '.join(['(' + ', '.join(['%s'] * len(COLUMNS)) + ')'] * len(rows))
+            db.execute_batch([(POSTGRES_INSERT_SQL + values, [value for row in rows for value in row])])
+
+    @staticmethod
+    def _rewrite(spool_file, records):
+        tmp_file = spool_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_file, spool_file)
+
+    @staticmethod
+    def _spool(spool_file, records):
+        if not records:
+            return
+        with open(spool_file, 'ab') as f:
+            if f.tell() > 0:
+                with open(spool_file, 'rb') as last:
+                    last.seek(-1, os.SEEK_END)
+                    if last.read(1) != b'\n':
+                        # 上次追加时进程退出留下了不完整的行，另起一行，避免与新记录连在一起
+                        f.write(b'\n')
+            for record in records:
+                f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+chat_record_writer = ChatRecordWriter()
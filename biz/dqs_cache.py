@@ -0,0 +1,202 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+def cache_key(params):
+    """
+    规范化请求参数（字典按键排序）后取摘要作为缓存键
+    """
+    text = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def is_history_period(data_time, today=None):
+    """
+    数据日期是否属于已结束的周期：按数据日期的长度（yyyy、yyyymm、yyyymmdd）与今天的同长度前缀比较
+    """
+    if not data_time or not str(data_time).isdigit():
+        return False
+    today = today or time.strftime('%Y%m%d')
+    data_time = str(data_time)
+    return data_time < today[:len(data_time)]
+
+
+class SqliteCacheBackend:
+    """
+    同一主机上多个 worker 共享的缓存，保存在 SQLite 文件中，值为 JSON
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS dqs_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM dqs_cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dqs_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), now + ttl),
+            )
+            conn.execute("DELETE FROM dqs_cache WHERE expires <= ?", (now,))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+class DQSResultCache:
+    """
+    DQS 指标数据的结果缓存。
+    - 已结束周期（上月、去年等）的数据不再变化，缓存 dqs_cache_history_ttl 秒；当前周期缓存 dqs_cache_current_ttl 秒
+    - 内存中最多保存 dqs_cache_size 条，按最近使用淘汰
+    - 同一个键同时未命中时只请求一次，其他请求等待同一个结果
+    - 配置 dqs_cache_path 时同时使用 SQLite 共享缓存，同一主机上的多个 worker 共用
+    - 缓存键只包含决定数据的参数；数据权限单独检查：调用方传入权限范围 scope（如用户所属单位），
+      某个范围的用户成功取到过该数据后，同一范围的其他用户才能使用缓存，其他范围按未命中处理
+    返回的是缓存值的副本，调用方可以修改。
+    """
+
+    def __init__(self):
+        self.configs = SysConfig.get_config()
+        self.enable = bool(self.configs.get('dqs_cache_enable', True))
+        self.max_size = int(self.configs.get('dqs_cache_size', 1024))
+        self.history_ttl = float(self.configs.get('dqs_cache_history_ttl', 86400))
+        self.current_ttl = float(self.configs.get('dqs_cache_current_ttl', 300))
+        path = self.configs.get('dqs_cache_path')
+        self.backend = SqliteCacheBackend(path) if path else None
+        self._cache = OrderedDict()  # key -> (过期时间, 值)
+        self._pending = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def get_or_fetch(self, params, data_time, fetch, scope=None):
+        """
+        :param params: 决定请求结果的参数，规范化后作为缓存键
+        :param data_time: 数据日期，决定缓存时长
+        :param fetch: 未命中时调用，返回 (dqs_data, dqs_url_params)；dqs_data 为空或抛出异常时不缓存
+        :param scope: 数据权限范围，为 None 时不检查权限
+        """
+        if not self.enable:
+            return fetch()
+        key = cache_key(params)
+        # 权限记录与数据分开保存，同一份数据可以被多个权限范围使用
+        grant = None if scope is None else cache_key(['scope', key, scope])
+        pending_key = grant or key
+        with self._lock:
+            value = self._get(key)
+            if value is not None and (grant is None or self._get(grant) is not None):
+                self.hits += 1
+                return copy.deepcopy(value)
+            future = self._pending.get(pending_key)
+            owner = future is None
+            if owner:
+                future = self._pending[pending_key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            value = self._get_shared(key)
+            if value is not None and (grant is None or self._get_shared(grant) is not None):
+                with self._lock:
+                    self.shared_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                value = fetch()
+                if value and value[0]:
+                    ttl = self.history_ttl if is_history_period(data_time) else self.current_ttl
+                    self._set(key, value, ttl)
+                    if grant is not None:
+                        self._set(grant, True, ttl)
+            future.set_result(value)
+            return copy.deepcopy(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(pending_key, None)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.shared_hits + self.coalesced + self.misses
+            return {
+                'size': len(self._cache),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_ratio': (requests - self.misses) / requests if requests else 0.0,
+            }
+
+    def _get(self, key):
+        # 调用方持有锁
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return item[1]
+
+    def _get_shared(self, key):
+        if not self.backend:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Failed to read shared DQS cache: %s", e)
+            return None
+        if value is not None:
+            # 共享缓存没有记录剩余时长，本地按当前周期的时长保存
+            self._put(key, value, self.current_ttl)
+        return value
+
+    def _set(self, key, value, ttl):
+        self._put(key, value, ttl)
+        if self.backend:
+            try:
+                self.backend.set(key, value, ttl)
+            except Exception as e:
+                logger.warning("Failed to write shared DQS cache: %s", e)
+
+    def _put(self, key, value, ttl):
+        with self._lock:
+            self._cache[key] = (time.time() + ttl, copy.deepcopy(value))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+
+dqs_cache = DQSResultCache()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+
+import faiss
+from sentence_transformers import SentenceTransformer
+
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+class MenuRetriever:
+    """
+    菜单检索引擎：模型和 Faiss 索引只加载一次，SQLite 使用线程内复用的只读连接。
+    每隔 check_interval 秒检查索引文件的修改时间，变化后在后台加载新索引并整体替换。
+    """
+
+    def __init__(self, model_path, index_path, database_path, mmap=False, check_interval=10):
+        self.model_path = model_path
+        self.index_path = index_path
+        self.database_path = database_path
+        self.mmap = mmap
+        self.check_interval = check_interval
+        self.model = None
+        self.index = None
+        self._index_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._local = threading.local()
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                start = time.time()
+                self.model = SentenceTransformer(self.model_path)
+                logger.info(f"Menu model loaded in {time.time() - start:.3f}s")
+            if self.index is None:
+                self._load_index()
+
+    def search(self, search_text, k=3):
+        """
+        :return: menu_index 表中与搜索文本最相关的 k 行
+        """
+        if self.model is None or self.index is None:
+            self.load()
+        self._check_index()
+
+        # 将搜索文本转换为向量
+        search_vector = self.model.encode([search_text]).astype('float32')
+
+        # 使用 Faiss 执行搜索，I 是相应的索引 ID
+        index = self.index
+        _, I = index.search(search_vector, k)
+        vector_ids = [int(vector_id) for vector_id in I[0] if vector_id >= 0]
+        if not vector_ids:
+            return []
+
+        # 用这些向量 ID 从 SQLite 数据库中检索相关信息
+        query = f"SELECT * FROM menu_index WHERE vector_id IN ({', '.join(['?'] * len(vector_ids))})"
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(query, vector_ids)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.database_path}?mode=ro', uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _load_index(self):
+        start = time.time()
+        mtime = os.path.getmtime(self.index_path)
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.mmap else 0
+        index = faiss.read_index(self.index_path, flags)
+        # 整体替换引用，正在进行的检索仍使用旧索引
+        self.index = index
+        self._index_mtime = mtime
+        self._checked_at = time.time()
+        logger.info(f"Menu index loaded in {time.time() - start:.3f}s, mmap: {self.mmap}")
+
+    def _check_index(self):
+        if time.time() - self._checked_at < self.check_interval or self._reloading:
+            return
+        self._checked_at = time.time()
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError as e:
+            logger.warning(f"Failed to stat menu index: {e}")
+            return
+        if mtime == self._index_mtime:
+            return
+
+        def reload():
+            try:
+                with self._lock:
+                    self._load_index()
+            except Exception as e:
+                logger.error(f"Failed to reload menu index: {e}", exc_info=True)
+            finally:
+                self._reloading = False
+
+        self._reloading = True
+        threading.Thread(target=reload, name='menu-index-reload', daemon=True).start()
@@ -0,0 +1,128 @@
+import heapq
+import math
+import threading
+
+import jieba
+
+
+def tokenize(text):
+    """
+    分词，去掉空白词
+
+    :param text: 文本
+    :return: 词列表
+    """
+    return [word for word in jieba.lcut(text or '') if word.strip()]
+
+
+class BM25Index:
+    """
+    常驻内存的BM25倒排索引，文档只在加入时分词一次，并预先计算词频、文档长度和逆文档频率，
+    查询时只遍历查询词对应的倒排表。
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs = {}  # doc_id -> 原始文档
+        self._doc_len = {}  # doc_id -> 文档长度
+        self._postings = {}  # term -> {doc_id: tf}
+        self._total_len = 0
+        self._idf = {}
+        self._norm = {}  # doc_id -> k1 * (1 - b + b * 文档长度 / 平均长度)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def build(self, docs):
+        """
+        全量重建索引
+
+        :param docs: (doc_id, text) 元组列表
+        """
+        with self._lock:
+            self._docs.clear()
+            self._doc_len.clear()
+            self._postings.clear()
+            self._total_len = 0
+            self._add(docs)
+            self._update_idf()
+
+    def add(self, docs):
+        """
+        增量加入文档，已存在的doc_id会被覆盖
+
+        :param docs: (doc_id, text) 元组列表
+        """
+        with self._lock:
+            self._remove([doc_id for doc_id, _ in docs if doc_id in self._docs])
+            self._add(docs)
+            self._update_idf()
+
+    def remove(self, doc_ids):
+        with self._lock:
+            self._remove(doc_ids)
+            self._update_idf()
+
+    def query(self, text, top_k):
+        """
+        查询与文本最相关的top_k个文档
+
+        :param text: 查询文本
+        :param top_k: 返回数量
+        :return: 按得分降序排列的 (doc_id, text) 元组列表，只包含得分大于0的文档
+        """
+        with self._lock:
+            if not self._docs:
+                return []
+            norms = self._norm
+            k1 = self.k1 + 1
+            scores = {}
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf[term] * k1
+                for doc_id, tf in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (tf + norms[doc_id])
+            best = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+            return [(doc_id, self._docs[doc_id]) for doc_id, score in best if score > 0]
+
+    def _add(self, docs):
+        for doc_id, text in docs:
+            terms = tokenize(text)
+            self._docs[doc_id] = text
+            self._doc_len[doc_id] = len(terms)
+            self._total_len += len(terms)
+            for term in terms:
+                postings = self._postings.setdefault(term, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def _remove(self, doc_ids):
+        for doc_id in doc_ids:
+            text = self._docs.pop(doc_id, None)
+            if text is None:
+                continue
+            self._total_len -= self._doc_len.pop(doc_id)
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def _update_idf(self):
+        n = len(self._docs)
+        self._idf = {
+            term: math.log((n - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+            for term, postings in self._postings.items()
+        }
+        avg_len = self._total_len / n if n else 0
+        self._norm = {
+            doc_id: self.k1 * (1 - self.b + self.b * doc_len / avg_len) if avg_len else self.k1
+            for doc_id, doc_len in self._doc_len.items()
+        }
@@ -1,5 +1,112 @@
 import numpy as np
 
+METRICS = ('l2', 'cosine', 'ip')
+
+
+def as_float32(vectors):
+    """
+    转换为连续的 float32 数组，已经是连续 float32 数组时不复制
+
+    :param vectors: 向量或矩阵，列表或数组
+    :return: np.ndarray
+    """
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def distances(query, matrix, metric='l2', out=None):
+    """
+    计算一个查询向量与矩阵中每一行的距离或相似度
+
+    :param query: 查询向量，形状 (d,)
+    :param matrix: 候选矩阵，形状 (n, d)
+    :param metric: l2 为欧几里得距离（越小越相似），cosine 为余弦相似度、ip 为内积（越大越相似）
+    :param out: 预分配的 float32 输出数组，形状 (n,)
+    :return: 形状 (n,) 的数组
+
+    l2 使用 ||m||² - 2m·q + ||q||² 展开计算，速度快但在 float32 下距离很小时有较大的相对误差，
+    只适合粗排；需要精确距离时使用 l2_distances
+    """
+    q = as_float32(query)
+    m = as_float32(matrix)
+    out = np.dot(m, q, out=out)
+    if metric == 'ip':
+        return out
+    if metric == 'cosine':
+        norms = np.sqrt(np.einsum('ij,ij->i', m, m))
+        norms *= np.sqrt(q @ q)
+        np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+        out /= norms
+        return out
+    if metric == 'l2':
+        # ||m||² - 2m·q + ||q||²
+        out *= -2
+        out += np.einsum('ij,ij->i', m, m)
+        out += q @ q
+        np.maximum(out, 0, out=out)
+        return np.sqrt(out, out=out)
+    raise ValueError(f"Unsupported metric: {metric}, expected one of {METRICS}")
+
+
+def l2_distances(query, matrix):
+    """
+    按差向量的范数计算精确的L2距离，用于候选集的精排
+
+    :param query: 查询向量，形状 (d,)
+    :param matrix: 候选矩阵，形状 (n, d)
+    :return: 形状 (n,) 的 float32 数组
+    """
+    diff = np.asarray(matrix, dtype=np.float32) - as_float32(query)
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+
+def pairwise_distances(queries, matrix, metric='l2', out=None):
+    """
+    计算两个矩阵各行之间的距离或相似度
+
+    :param queries: 查询矩阵，形状 (m, d)
+    :param matrix: 候选矩阵，形状 (n, d)
+    :param metric: l2、cosine 或 ip，含义同 distances
+    :param out: 预分配的 float32 输出数组，形状 (m, n)
+    :return: 形状 (m, n) 的数组
+    """
+    a = as_float32(queries)
+    b = as_float32(matrix)
+    out = np.dot(a, b.T, out=out)
+    if metric == 'ip':
+        return out
+    a_norms = np.einsum('ij,ij->i', a, a)
+    b_norms = np.einsum('ij,ij->i', b, b)
+    if metric == 'cosine':
+        scale = np.sqrt(np.outer(a_norms, b_norms))
+        np.maximum(scale, np.finfo(np.float32).tiny, out=scale)
+        out /= scale
+        return out
+    if metric == 'l2':
+        out *= -2
+        out += a_norms[:, None]
+        out += b_norms[None, :]
+        np.maximum(out, 0, out=out)
+        return np.sqrt(out, out=out)
+    raise ValueError(f"Unsupported metric: {metric}, expected one of {METRICS}")
+
+
+def top_k(scores, k, largest=False):
+    """
+    用 argpartition 选出前 k 个，再只对这 k 个排序
+
+    :param scores: 一维距离或相似度数组
+    :param k: 数量
+    :param largest: True 取最大的 k 个（相似度），False 取最小的 k 个（距离）
+    :return: 排好序的下标数组
+    """
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    keys = -scores if largest else scores
+    indexes = np.argpartition(keys, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return indexes[np.argsort(keys[indexes], kind='stable')]
+
 
 def l2_distance(point1, point2):
     """
@@ -9,6 +116,5 @@ def l2_distance(point1, point2):
     :param point2: 第二个点的坐标，列表或数组
     :return: L2距离
     """
-    point1 = np.array(point1)
-    point2 = np.array(point2)
-    return np.linalg.norm(point1 - point2)
\ No newline at end of file
+    diff = np.asarray(point1, dtype=np.float64) - np.asarray(point2, dtype=np.float64)
+    return float(np.sqrt(diff @ diff))
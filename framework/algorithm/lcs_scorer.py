@@ -0,0 +1,123 @@
+class LCSScorer:
+    """
+    只计算长度的最长公共子序列/最长公共子串打分器。
+    查询串的预处理（字符位掩码、后缀自动机）只做一次，之后对每个候选串的打分都是 O(len(候选串))：
+    - 最长公共子序列长度：位并行算法（Hyyrö），用 Python 大整数作为位向量
+    - 最长公共子串长度：在查询串的后缀自动机上匹配候选串
+    """
+
+    def __init__(self, query):
+        self.query = query or ''
+        self._full = (1 << len(self.query)) - 1
+        self._masks = {}
+        for i, ch in enumerate(self.query):
+            self._masks[ch] = self._masks.get(ch, 0) | (1 << i)
+        self._build_automaton()
+
+    def subsequence_length(self, text):
+        """
+        最长公共子序列长度
+        """
+        full = self._full
+        masks = self._masks
+        v = full
+        for ch in text:
+            u = v & masks.get(ch, 0)
+            v = ((v + u) | (v - u)) & full
+        return len(self.query) - bin(v).count('1')
+
+    def substring_length(self, text):
+        """
+        最长公共子串长度
+        """
+        nexts, links, lengths = self._next, self._link, self._len
+        state, length, best = 0, 0, 0
+        for ch in text:
+            while state and ch not in nexts[state]:
+                state = links[state]
+                length = lengths[state]
+            if ch in nexts[state]:
+                state = nexts[state][ch]
+                length += 1
+            if length > best:
+                best = length
+        return best
+
+    def score(self, text):
+        """
+        :return: (最长公共子序列长度, 最长公共子串长度)
+        """
+        return self.subsequence_length(text), self.substring_length(text)
+
+    def score_batch(self, texts):
+        return [self.score(text) for text in texts]
+
+    def _build_automaton(self):
+        # 状态0为初始状态
+        self._next = [{}]
+        self._link = [-1]
+        self._len = [0]
+        last = 0
+        for ch in self.query:
+            cur = len(self._len)
+            self._next.append({})
+            self._link.append(0)
+            self._len.append(self._len[last] + 1)
+            p = last
+            while p != -1 and ch not in self._next[p]:
+                self._next[p][ch] = cur
+                p = self._link[p]
+            if p != -1:
+                q = self._next[p][ch]
+                if self._len[p] + 1 == self._len[q]:
+                    self._link[cur] = q
+                else:
+                    clone = len(self._len)
+                    self._next.append(dict(self._next[q]))
+                    self._link.append(self._link[q])
+                    self._len.append(self._len[p] + 1)
+                    while p != -1 and self._next[p].get(ch) == q:
+                        self._next[p][ch] = clone
+                        p = self._link[p]
+                    self._link[q] = clone
+                    self._link[cur] = clone
+            last = cur
+        self._link[0] = 0
+
+
+def score_batch(texts, query):
+    """
+    对一批候选串计算与查询串的 (最长公共子序列长度, 最长公共子串长度)
+
+    :param texts: 候选串列表
+    :param query: 查询串
+    :return: 与 texts 顺序一致的长度元组列表
+    """
+    return LCSScorer(query).score_batch(texts)
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    from framework.algorithm.lcs_finder import longest_common_subsequence, longest_common_substring
+
+    random.seed(0)
+    chars = '售电量线损率客户数供电单位同比环比增长统计分析报表月年季度城市农村用户欠费停电'
+    query_text = '2024年9月西安供电公司城市居民用户的售电量和线损率同比增长情况是多少'
+    candidates = [''.join(random.choice(chars) for _ in range(random.randint(40, 120))) for _ in range(200)]
+
+    start = time.time()
+    expected = [
+        (len(longest_common_subsequence(c, query_text)), len(longest_common_substring(c, query_text)))
+        for c in candidates
+    ]
+    dp_duration = time.time() - start
+
+    start = time.time()
+    actual = score_batch(candidates, query_text)
+    scorer_duration = time.time() - start
+
+    assert actual == expected
+    print(f"candidates: {len(candidates)}, lcs_finder: {dp_duration:.4f}s, lcs_scorer: {scorer_duration:.4f}s, "
+          f"speedup: {dp_duration / scorer_duration:.1f}x")
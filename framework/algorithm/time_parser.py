@@ -0,0 +1,93 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from framework.algorithm.jionlp_data_collect import jio_parse_time_point, time_wash_text
+from utils.config_utils import SysConfig
+
+# 可能表示时间的字符，文本中一个都没有时不调用 jionlp
+TIME_HINT = re.compile(
+    r'[0-9０-９〇零一二三四五六七八九十两年月日号季周天今昨明前去上下本近当初底末旬时点分春夏秋冬节期]|星期|礼拜|现在'
+)
+# 常见的绝对日期和季度写法：2024年、2024年9月、2024年9月30日、三季度、2024年第3季度
+SIMPLE_TIME = re.compile(
+    r'(?:(?:19|20)\d{2}年)?第?[一二三四1-4]季度'
+    r'|(?:19|20)\d{2}年(?:(?:1[0-2]|0?[1-9])月(?:(?:3[01]|[12]\d|0?[1-9])[日号])?)?'
+)
+
+
+class TimeParser:
+    """
+    分层的时间解析：
+    1. 按 (规范化文本, 当天日期) 缓存解析结果（LRU）
+    2. 文本中没有任何时间相关字符时直接返回空结果
+    3. 只包含一个常见日期或季度写法时，只对该片段调用 jionlp，片段结果同样缓存，不同问题可以共用
+    4. 其他情况对全文调用 jionlp
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fast_paths = 0
+
+    def time_point(self, text):
+        """
+        与 jio_parse_time_point 结果相同
+        """
+        result = self.cached('time_point', text, self._time_point)
+        return list(result) if result else []
+
+    def wash(self, text):
+        """
+        与 time_wash_text 结果相同
+        """
+        return self.cached('wash', text, time_wash_text)
+
+    def cached(self, name, text, compute):
+        """
+        按 (name, 规范化文本, 当天日期) 缓存 compute(text) 的结果，相对时间跨天后重新计算
+        """
+        key = (name, ' '.join(str(text).split()), time.strftime('%Y%m%d'))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        value = compute(text)
+        if isinstance(value, list):
+            value = tuple(value)
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'fast_paths': self.fast_paths,
+            }
+
+    def _time_point(self, text):
+        if not TIME_HINT.search(text):
+            self.fast_paths += 1
+            return ()
+        matches = list(SIMPLE_TIME.finditer(text))
+        if len(matches) == 1:
+            match = matches[0]
+            if not TIME_HINT.search(text[:match.start()] + text[match.end():]):
+                self.fast_paths += 1
+                return self.cached('time_point', match.group(), jio_parse_time_point)
+        return jio_parse_time_point(text)
+
+
+time_parser = TimeParser(int(SysConfig.get_config().get('time_parse_cache_size', 4096)))
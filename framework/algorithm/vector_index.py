@@ -0,0 +1,119 @@
+import json
+import os
+import uuid
+
+import numpy as np
+
+from framework.algorithm.embed_dis import as_float32, l2_distances, top_k as select_top_k
+
+
+class VectorIndex:
+    """
+    精确L2近邻检索的向量矩阵，向量可按 float16 量化存储以减半内存，并可保存为 .npy 后以内存映射方式只读加载，
+    多个进程加载同一文件时共享操作系统页缓存。
+    保存的快照由 <path>.json 清单和它引用的 ids、向量两个 .npy 文件组成，清单最后原子写入，加载时 ids 与向量总是同一次保存的。
+    检索时先用 ||x||² - 2x·q + ||q||² 在全量矩阵上粗排出 2*top_k 个候选，再按差向量的范数计算精确距离取 top_k。
+    """
+
+    def __init__(self, dtype='float32'):
+        self.dtype = np.dtype(dtype)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, 0), dtype=self.dtype)
+        self.norms = np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, vectors):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = np.asarray(vectors, dtype=self.dtype).reshape(len(self.ids), -1)
+        self._update_norms()
+        return self
+
+    def append(self, ids, vectors):
+        if not len(self.ids):
+            return self.build(ids, vectors)
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(len(ids), -1)
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.matrix = np.concatenate([self.matrix, vectors])
+        self._update_norms()
+        return self
+
+    def search(self, query, top_k, rows=None):
+        """
+        :param query: 查询向量
+        :param top_k: 返回数量
+        :param rows: 只在这些行（矩阵下标）中检索，为 None 时检索全部
+        :return: (ids, distances)，按L2距离升序
+        """
+        if not len(self.ids) or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = as_float32(query)
+        if rows is None:
+            rows = np.arange(len(self.ids))
+            squared = self.norms - 2 * (self.matrix @ q) + q @ q
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            squared = self.norms[rows] - 2 * (self.matrix[rows] @ q) + q @ q
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        n = min(top_k * 2, len(rows))
+        candidates = rows[np.argpartition(squared, n - 1)[:n]] if n < len(rows) else rows
+        candidate_distances = l2_distances(q, self.matrix[candidates])
+        order = select_top_k(candidate_distances, top_k)
+        return self.ids[candidates[order]], candidate_distances[order]
+
+    def rows_of(self, ids):
+        """
+        :return: ids 在矩阵中的行下标，不存在的 id 被忽略
+        """
+        return np.flatnonzero(np.isin(self.ids, np.asarray(ids, dtype=np.int64)))
+
+    def save(self, path):
+        """
+        数据文件名各不相同，全部写完后再经临时文件改名写入清单，其他进程不会读到写了一半或不配套的文件
+        """
+        token = f'{os.getpid()}_{uuid.uuid4().hex[:8]}'
+        manifest = {}
+        for name, array in (('ids', self.ids), ('vec', self.matrix)):
+            file = f'{path}.{token}.{name}.npy'
+            with open(file, 'wb') as f:
+                np.save(f, array)
+            manifest[name] = os.path.basename(file)
+        tmp_file = f'{path}.json.{token}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, path + '.json')
+
+    @staticmethod
+    def files(path):
+        """
+        :return: 清单引用的 {'ids': 文件路径, 'vec': 文件路径}，清单不存在或已损坏时返回None
+        """
+        try:
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        directory = os.path.dirname(path)
+        return {name: os.path.join(directory, file) for name, file in manifest.items()}
+
+    @classmethod
+    def exists(cls, path):
+        files = cls.files(path)
+        return files is not None and all(os.path.exists(file) for file in files.values())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        files = cls.files(path)
+        if files is None:
+            raise FileNotFoundError(f"Vector index manifest not found: {path}.json")
+        matrix = np.load(files['vec'], mmap_mode='r' if mmap else None)
+        index = cls(matrix.dtype)
+        index.ids = np.load(files['ids'])
+        index.matrix = matrix
+        index._update_norms()
+        return index
+
+    def _update_norms(self):
+        self.norms = np.einsum('ij,ij->i', self.matrix, self.matrix, dtype=np.float32)
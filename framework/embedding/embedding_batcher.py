@@ -0,0 +1,163 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from framework.embedding.m3e_client import m3e_client
+from utils.async_utils import blocking_executor
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+# 批大小直方图的桶上界
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    """
+    嵌入请求动态合批。
+    并发的 get_embeddings 请求进入队列，后台线程最多收集 max_batch_size 条文本或等待 max_wait_ms 毫秒，
+    按模型合并为一次请求发送，再把向量分发回各个等待的调用方。
+    合并后的请求在线程池中发送，最多同时有 max_concurrency 批在途；全部在途时新请求继续在队列中积攒，
+    有空闲后合为更大的一批发送，单个慢响应不会阻塞其他请求。
+    同步调用方阻塞等待结果，异步调用方使用 aget_embeddings；已取消的请求不再发送。
+    """
+
+    def __init__(self, client, max_batch_size=32, max_wait_ms=5, max_concurrency=4):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.batches = 0
+        self.items = 0
+        self.histogram = {bucket: 0 for bucket in HISTOGRAM_BUCKETS}
+        self.histogram['+Inf'] = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='embedding-batch')
+
+    def get_embeddings(self, texts, model_name):
+        if self.max_batch_size <= 1:
+            # 不合批，在调用方线程中直接请求
+            future = Future()
+            self._send(model_name, [(self._as_list(texts), future)])
+            return future.result()
+        return self.submit(texts, model_name).result()
+
+    async def aget_embeddings(self, texts, model_name):
+        return await asyncio.wrap_future(self.submit(texts, model_name))
+
+    def submit(self, texts, model_name):
+        texts = self._as_list(texts)
+        future = Future()
+        if self.max_batch_size <= 1:
+            # 不合批，在线程池中直接请求，不阻塞调用方的事件循环
+            blocking_executor.submit(self._send, model_name, [(texts, future)])
+            return future
+        self._ensure_worker()
+        self._queue.put((texts, model_name, future))
+        return future
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'histogram': {str(bucket): count for bucket, count in self.histogram.items()},
+        }
+
+    @staticmethod
+    def _as_list(texts):
+        return [texts] if isinstance(texts, str) else list(texts)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            # 先占用一个在途名额，名额用完时请求留在队列中积攒
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            count = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            try:
+                self._executor.submit(self._dispatch, batch)
+            except Exception as e:
+                self._slots.release()
+                logger.error("Failed to dispatch embedding batch: %s", e, exc_info=True)
+                for _, _, future in batch:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+
+    def _dispatch(self, batch):
+        try:
+            groups = {}
+            for texts, model_name, future in batch:
+                groups.setdefault(model_name, []).append((texts, future))
+            for model_name, requests in groups.items():
+                self._send(model_name, requests)
+        finally:
+            self._slots.release()
+
+    def _send(self, model_name, requests):
+        # 调用方已取消的请求直接丢弃，其余的标记为运行中，之后不会再被取消
+        requests = [(texts, future) for texts, future in requests if future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+        try:
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            self._record(len(texts))
+            response = self.client.get_embeddings(texts, model_name)
+            start = 0
+            for request_texts, future in requests:
+                if not response:
+                    future.set_result(None)
+                    continue
+                data = response['data'][start: start + len(request_texts)]
+                future.set_result({'data': [{**item, 'index': i} for i, item in enumerate(data)]})
+                start += len(request_texts)
+        except Exception as e:
+            logger.error("Batched embedding request failed: %s", e, exc_info=True)
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _record(self, size):
+        # 多个批次并发发送，统计需要加锁
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            for bucket in HISTOGRAM_BUCKETS:
+                if size <= bucket:
+                    self.histogram[bucket] += 1
+                    return
+            self.histogram['+Inf'] += 1
+
+
+_configs = SysConfig.get_config()
+m3e_batcher = EmbeddingBatcher(
+    m3e_client,
+    max_batch_size=int(_configs.get('embedding_batch_size', 32)),
+    max_wait_ms=float(_configs.get('embedding_batch_wait_ms', 5)),
+    max_concurrency=int(_configs.get('embedding_batch_concurrency', 4)),
+)
@@ -0,0 +1,336 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+
+from framework.embedding.embedding_batcher import m3e_batcher
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+def normalize_text(text):
+    return ' '.join(str(text).split())
+
+
+class DiskEmbeddingStore:
+    """
+    磁盘向量存储，重启后仍然有效，可由多个 worker 进程共享。
+    向量以 float32 追加写入 vectors.f32，索引以 jsonl 追加写入 index.jsonl。
+    写入和压缩持有排他文件锁，偏移量取自向量文件的实际长度；读取持有共享锁，并增量读入其他进程追加的索引。
+    条目数超过 max_entries 时压缩为最新写入的一半，压缩后文件 inode 变化，其他进程据此重新加载。
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+        self.vector_file = os.path.join(path, 'vectors.f32')
+        self.index_file = os.path.join(path, 'index.jsonl')
+        self._index = {}  # key -> (偏移量, 维度, 写入时间)
+        self._index_pos = 0  # 已读入的索引文件字节数
+        self._index_ino = None
+        self._vector_fd = None
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(os.path.join(path, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        with self._locked(fcntl.LOCK_SH):
+            self._refresh()
+        logger.info("Loaded %s embeddings from %s", len(self._index), self.path)
+
+    def get(self, key, ttl):
+        with self._locked(fcntl.LOCK_SH):
+            self._refresh()
+            entry = self._index.get(key)
+            if entry is None or self._vector_fd is None:
+                return None
+            offset, dim, ts = entry
+            if ttl and time.time() - ts > ttl:
+                return None
+            data = os.pread(self._vector_fd, dim * 4, offset * 4)
+        if len(data) < dim * 4:
+            return None
+        return np.frombuffer(data, dtype=np.float32).tolist()
+
+    def put(self, key, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        ts = time.time()
+        with self._locked(fcntl.LOCK_EX):
+            self._refresh()
+            with open(self.vector_file, 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % 4:
+                    # 进程异常退出时可能留下不完整的向量，补齐到 float32 边界
+                    f.write(b'\0' * (4 - size % 4))
+                    size += 4 - size % 4
+                f.write(vector.tobytes())
+            with open(self.index_file, 'a+b') as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        # 同上，不完整的最后一行单独成行，读取时跳过
+                        f.write(b'\n')
+                f.write((json.dumps([list(key), size // 4, len(vector), ts], ensure_ascii=False) + '\n').encode('utf-8'))
+            self._refresh()
+            if self.max_entries and len(self._index) > self.max_entries:
+                self._compact()
+
+    def stats(self):
+        return {'size': len(self._index), 'max_entries': self.max_entries}
+
+    @contextmanager
+    def _locked(self, operation):
+        # flock 只在进程之间互斥，同一进程内的线程再用线程锁互斥
+        with self._lock:
+            fcntl.flock(self._lock_fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """读入索引文件中新追加的行，索引文件被压缩替换时重新加载"""
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            self._reset(None)
+            return
+        if stat.st_ino != self._index_ino or stat.st_size < self._index_pos:
+            self._reset(stat.st_ino)
+        if stat.st_size == self._index_pos:
+            return
+        with open(self.index_file, 'rb') as f:
+            f.seek(self._index_pos)
+            data = f.read(stat.st_size - self._index_pos)
+        # 只处理完整的行
+        data = data[:data.rfind(b'\n') + 1]
+        self._index_pos += len(data)
+        vector_size = os.fstat(self._vector_fd).st_size // 4 if self._vector_fd is not None else 0
+        for line in data.splitlines():
+            try:
+                key, offset, dim, ts = json.loads(line)
+            except ValueError:
+                continue
+            if offset + dim <= vector_size:
+                self._index[tuple(key)] = (offset, dim, ts)
+
+    def _reset(self, index_ino):
+        self._index = {}
+        self._index_pos = 0
+        self._index_ino = index_ino
+        if self._vector_fd is not None:
+            os.close(self._vector_fd)
+            self._vector_fd = None
+        if index_ino is not None and os.path.exists(self.vector_file):
+            self._vector_fd = os.open(self.vector_file, os.O_RDONLY)
+
+    def _compact(self):
+        """保留最新写入且未过期的一半条目，写入临时文件后替换，调用方持有排他锁"""
+        now = time.time()
+        entries = sorted(self._index.items(), key=lambda item: item[1][2], reverse=True)
+        entries = [(key, entry) for key, entry in entries if not self.ttl or now - entry[2] <= self.ttl]
+        entries = entries[: self.max_entries // 2]
+        vector_tmp = self.vector_file + '.tmp'
+        index_tmp = self.index_file + '.tmp'
+        size = 0
+        with open(vector_tmp, 'wb') as vf, open(index_tmp, 'w', encoding='utf-8') as jf:
+            for key, (offset, dim, ts) in reversed(entries):
+                vf.write(os.pread(self._vector_fd, dim * 4, offset * 4))
+                jf.write(json.dumps([list(key), size, dim, ts], ensure_ascii=False) + '\n')
+                size += dim
+        os.replace(vector_tmp, self.vector_file)
+        os.replace(index_tmp, self.index_file)
+        self._reset(None)
+        self._refresh()
+        logger.info("Compacted embedding disk cache %s to %s entries", self.path, len(self._index))
+
+
+class EmbeddingCache:
+    """
+    嵌入向量缓存，按 (model_name, 规范化文本) 缓存 get_embeddings 的结果。
+    内存中为带TTL的有界LRU，可选磁盘层；未命中的文本交给 client（合批器或 m3e_client）请求。
+    并发请求中同一文本的未命中只请求一次，其余调用方等待同一个结果。
+    接口与 m3e_client.get_embeddings 一致，可直接替换。
+    """
+
+    def __init__(self, client, max_size=1024, ttl=86400, disk_path=None, disk_size=100000):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk = DiskEmbeddingStore(disk_path, max_entries=disk_size, ttl=ttl) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._cache = OrderedDict()  # key -> (embedding, 写入时间)
+        self._pending = {}  # key -> 正在请求中的 Future
+        self._lock = threading.Lock()
+
+    def get_embeddings(self, texts, model_name):
+        """
+        :param texts: 文本或文本列表
+        :param model_name: 模型名称
+        :return: {'data': [{'index': i, 'embedding': [...]}, ...]}，嵌入服务无响应时返回None
+        """
+        keys, embeddings, miss_keys = self._lookup(texts, model_name)
+        if miss_keys:
+            owned, waiting = self._claim(miss_keys)
+            fetched = {}
+            if owned:
+                try:
+                    response = self.client.get_embeddings([key[1] for key in owned], model_name)
+                except Exception as e:
+                    self._resolve(owned, None, e)
+                    raise
+                fetched = self._store(owned, response)
+                if fetched is None:
+                    return None
+            for key, future in waiting.items():
+                fetched[key] = future.result()
+                if fetched[key] is None:
+                    return None
+            self._fill(keys, embeddings, fetched)
+        return {'data': [{'index': i, 'embedding': embedding} for i, embedding in enumerate(embeddings)]}
+
+    async def aget_embeddings(self, texts, model_name):
+        keys, embeddings, miss_keys = self._lookup(texts, model_name)
+        if miss_keys:
+            owned, waiting = self._claim(miss_keys)
+            fetched = {}
+            if owned:
+                try:
+                    response = await self.client.aget_embeddings([key[1] for key in owned], model_name)
+                except Exception as e:
+                    self._resolve(owned, None, e)
+                    raise
+                except BaseException:
+                    # 请求方被取消时，等待同一文本的其他调用方不能一直挂起
+                    self._resolve(owned, None, RuntimeError("Embedding request cancelled"))
+                    raise
+                fetched = self._store(owned, response)
+                if fetched is None:
+                    return None
+            for key, future in waiting.items():
+                # shield 防止本调用方被取消时连带取消共享的 Future
+                fetched[key] = await asyncio.shield(asyncio.wrap_future(future))
+                if fetched[key] is None:
+                    return None
+            self._fill(keys, embeddings, fetched)
+        return {'data': [{'index': i, 'embedding': embedding} for i, embedding in enumerate(embeddings)]}
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {
+            'size': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+        if self.disk:
+            stats['disk'] = self.disk.stats()
+        return stats
+
+    def _lookup(self, texts, model_name):
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        keys = [(model_name, normalize_text(text)) for text in texts]
+        embeddings = [self._get(key) for key in keys]
+        # 同一批次中重复的文本只请求一次
+        miss_keys = list(dict.fromkeys(key for key, embedding in zip(keys, embeddings) if embedding is None))
+        return keys, embeddings, miss_keys
+
+    def _claim(self, miss_keys):
+        """
+        登记未命中的文本
+        :return: (由本调用方请求的键列表, {其他调用方正在请求的键: Future})
+        """
+        owned, waiting = [], {}
+        with self._lock:
+            for key in miss_keys:
+                future = self._pending.get(key)
+                if future is None:
+                    self._pending[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+            self.coalesced += len(waiting)
+        return owned, waiting
+
+    def _resolve(self, owned, fetched, error=None):
+        with self._lock:
+            futures = [self._pending.pop(key) for key in owned]
+        for key, future in zip(owned, futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(fetched.get(key) if fetched else None)
+
+    def _store(self, owned, response):
+        """写入缓存并通知等待方，嵌入服务无响应时返回None"""
+        if not response:
+            self._resolve(owned, None)
+            return None
+        fetched = {key: item['embedding'] for key, item in zip(owned, response['data'])}
+        for key, embedding in fetched.items():
+            self._put(key, embedding)
+        self._resolve(owned, fetched)
+        return fetched
+
+    @staticmethod
+    def _fill(keys, embeddings, fetched):
+        for i, key in enumerate(keys):
+            if embeddings[i] is None:
+                embeddings[i] = fetched[key]
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if not self.ttl or time.time() - entry[1] <= self.ttl:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._cache[key]
+        # 磁盘层有自己的锁，读写磁盘时不阻塞其他线程的内存查找
+        embedding = self.disk.get(key, self.ttl) if self.disk else None
+        with self._lock:
+            if embedding is not None:
+                self._set(key, embedding)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+            return None
+
+    def _put(self, key, embedding):
+        with self._lock:
+            self._set(key, embedding)
+        if self.disk:
+            try:
+                self.disk.put(key, embedding)
+            except OSError as e:
+                logger.warning("Failed to write embedding cache to disk: %s", e)
+
+    def _set(self, key, embedding):
+        self._cache[key] = (embedding, time.time())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+_configs = SysConfig.get_config()
+cached_m3e_client = EmbeddingCache(
+    m3e_batcher,
+    max_size=int(_configs.get('embedding_cache_size', 1024)),
+    ttl=float(_configs.get('embedding_cache_ttl', 86400)),
+    disk_path=_configs.get('embedding_cache_path') or None,
+    disk_size=int(_configs.get('embedding_cache_disk_size', 100000)),
+)
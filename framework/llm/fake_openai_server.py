@@ -0,0 +1,108 @@
+"""
+本地模拟的 OpenAI 兼容大模型服务，用于在没有真实模型时测试多地址负载均衡、摘除和流式输出：
+
+    python -m framework.llm.fake_openai_server --port 18001 --delay 0.02 --fail-rate 0.1
+
+/v1/models 返回模型列表，/v1/chat/completions 支持 stream；--first-token-delay、--delay 控制首个和后续内容的间隔，
+--fail-rate 为请求返回 500 的比例，也可以通过 POST /admin/config 在运行时修改这些参数。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+settings = {
+    'model': 'fake-model',
+    'reply': '这是模拟的大模型回答。',
+    'first_token_delay': 0.1,
+    'delay': 0.02,
+    'fail_rate': 0.0,
+}
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    return {'object': 'list', 'data': [{'id': settings['model'], 'object': 'model', 'owned_by': 'fake'}]}
+
+
+@app.post("/admin/config")
+async def config(data: dict):
+    settings.update({key: value for key, value in data.items() if key in settings})
+    return settings
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(data: dict):
+    if random.random() < float(settings['fail_rate']):
+        return JSONResponse({'error': {'message': 'fake failure', 'type': 'server_error'}}, status_code=500)
+
+    model = data.get('model') or settings['model']
+    completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+    reply = settings['reply']
+    await asyncio.sleep(float(settings['first_token_delay']))
+
+    if not data.get('stream'):
+        await asyncio.sleep(float(settings['delay']) * len(reply))
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in data.get('messages', []))
+        return {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [
+                {'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}
+            ],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(reply),
+                'total_tokens': prompt_tokens + len(reply),
+            },
+        }
+
+    async def stream():
+        yield f"data: {json.dumps(_chunk(completion_id, model, {'role': 'assistant'}), ensure_ascii=False)}\n\n"
+        for char in reply:
+            yield f"data: {json.dumps(_chunk(completion_id, model, {'content': char}), ensure_ascii=False)}\n\n"
+            await asyncio.sleep(float(settings['delay']))
+        yield f"data: {json.dumps(_chunk(completion_id, model, {}, 'stop'), ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type='text/event-stream')
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18001)
+    parser.add_argument('--model', default=settings['model'])
+    parser.add_argument('--reply', default=settings['reply'])
+    parser.add_argument('--first-token-delay', type=float, default=settings['first_token_delay'])
+    parser.add_argument('--delay', type=float, default=settings['delay'])
+    parser.add_argument('--fail-rate', type=float, default=settings['fail_rate'])
+    args = parser.parse_args()
+    settings.update(
+        model=args.model,
+        reply=args.reply,
+        first_token_delay=args.first_token_delay,
+        delay=args.delay,
+        fail_rate=args.fail_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,156 @@
+import asyncio
+import atexit
+import threading
+
+import httpx
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_clients = {}  # (model_type, base_url, balancer) -> httpx.Client
+_async_clients = {}  # (model_type, base_url, balancer, 事件循环) -> httpx.AsyncClient
+_lock = threading.Lock()
+
+
+def _transport_options():
+    configs = SysConfig.get_config()
+    return {
+        'http2': bool(configs.get('llm_http2', True)) and HTTP2_AVAILABLE,
+        'limits': httpx.Limits(
+            max_connections=int(configs.get('llm_http_max_connections', 100)),
+            max_keepalive_connections=int(configs.get('llm_http_max_keepalive', 20)),
+            keepalive_expiry=float(configs.get('llm_http_keepalive_expiry', 30)),
+        ),
+    }
+
+
+def _timeout():
+    configs = SysConfig.get_config()
+    return httpx.Timeout(
+        float(configs.get('llm_http_timeout', 120)),
+        connect=float(configs.get('llm_http_connect_timeout', 10)),
+    )
+
+
+def get_http_client(model_type, base_url, balancer=None):
+    """
+    按 (模型类型, 服务地址) 共享的同步 HTTP 客户端，连接保持复用，不要关闭
+
+    :param balancer: 提供 transport(inner) 的负载均衡器（如 LLMBackendPool），每个请求由它选择实际的服务地址
+    :return: httpx.Client
+    """
+    key = (model_type, base_url, balancer)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                transport = httpx.HTTPTransport(**_transport_options())
+                if balancer is not None:
+                    transport = balancer.transport(base_url, transport)
+                client = httpx.Client(transport=transport, timeout=_timeout())
+                _clients[key] = client
+                logger.info("Created shared LLM http client for %s %s", model_type, base_url)
+    return client
+
+
+def get_async_http_client(model_type, base_url, balancer=None):
+    """
+    按 (模型类型, 服务地址, 当前事件循环) 共享的异步 HTTP 客户端，连接保持复用，不要关闭
+
+    :param balancer: 提供 async_transport(inner) 的负载均衡器，同 get_http_client
+    :return: httpx.AsyncClient
+    """
+    key = (model_type, base_url, balancer, asyncio.get_running_loop())
+    client = _async_clients.get(key)
+    if client is None:
+        transport = httpx.AsyncHTTPTransport(**_transport_options())
+        if balancer is not None:
+            transport = balancer.async_transport(base_url, transport)
+        client = httpx.AsyncClient(transport=transport, timeout=_timeout())
+        _async_clients[key] = client
+        logger.info("Created shared async LLM http client for %s %s", model_type, base_url)
+    return client
+
+
+def _configured_urls():
+    """
+    :return: 系统配置中的模型服务地址（llm_base_url 和 llm_backends 中的地址）
+    """
+    configs = SysConfig.get_config()
+    urls = {configs.get('llm_base_url')}
+    for backend_urls in (configs.get('llm_backends') or {}).values():
+        urls.update(backend_urls)
+    urls.discard(None)
+    return urls
+
+
+def with_http_clients(configs, balancer=None):
+    """
+    在模型配置中加入按 (model_type, llm_base_url) 共享的 HTTP 客户端，键名与 OpenAI 客户端的参数一致
+    （http_client、http_async_client），创建模型客户端时直接传入，不再每次新建连接。需要在事件循环中调用。
+    共享客户端不会释放，只为系统配置中的服务地址创建；客户端请求中指定的其他地址原样返回，由模型客户端自行连接。
+
+    :param configs: 模型配置
+    :param balancer: 负载均衡器，传入时每次调用大模型都重新选择服务地址
+    :return: 新的配置字典，未配置 llm_base_url 或地址不在系统配置中时原样返回
+    """
+    model_type = configs.get('model_type', 'openai')
+    base_url = configs.get('llm_base_url')
+    if not base_url:
+        return configs
+    if base_url not in _configured_urls():
+        logger.debug("LLM base url %s is not configured, not using shared http clients", base_url)
+        return configs
+    return {
+        **configs,
+        'http_client': get_http_client(model_type, base_url, balancer),
+        'http_async_client': get_async_http_client(model_type, base_url, balancer),
+    }
+
+
+def close_http_clients():
+    """
+    关闭所有同步客户端，进程退出时自动调用
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug("Failed to close LLM http client: %s", e)
+
+
+async def aclose_http_clients():
+    """
+    关闭当前事件循环的异步客户端，在应用 shutdown 时调用
+    """
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _async_clients if key[-1] is loop]:
+        client = _async_clients.pop(key)
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug("Failed to close async LLM http client: %s", e)
+
+
+def http_client_stats():
+    return {
+        'http2': HTTP2_AVAILABLE,
+        'clients': [f'{key[0]} {key[1]}' for key in _clients],
+        'async_clients': [f'{key[0]} {key[1]}' for key in _async_clients],
+    }
+
+
+atexit.register(close_http_clients)
@@ -0,0 +1,330 @@
+import itertools
+import threading
+import time
+
+import httpx
+
+from framework.llm.http_clients import get_http_client
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+
+class LLMBackend:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None  # 请求耗时的指数加权移动平均（秒）
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def ejected(self):
+        return self.ejected_until > 0
+
+    def stats(self):
+        return {
+            'outstanding': self.outstanding,
+            'latency': self.latency,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejected': self.ejected,
+        }
+
+
+class LLMBackendPool:
+    """
+    同一模型的多个等价服务地址之间的负载均衡：
+    - least_outstanding 选择进行中请求最少的地址，ewma 选择 (进行中请求数 + 1) * 平均耗时 最小的地址
+    - 连续失败 llm_backend_max_failures 次的地址被摘除，llm_backend_eject_seconds 秒后由后台探测
+      （GET {url}/models）成功才恢复；全部被摘除时仍在其中选择，避免完全不可用
+    - 负载相同（如都没有进行中的请求、ewma 下都还没有耗时记录）时轮流选择，避免总是落到第一个地址
+    - 连接建立失败时换一个地址重试一次，请求已发出后不重试，保证同一请求不会被执行两次
+    - transport/async_transport 包装 HTTP 客户端的传输层，发往 llm_base_url 的每个请求都重新选择地址，
+      对话链使用这样的共享客户端（见 with_http_clients）即可逐次调用均衡，无需感知多个地址
+    """
+
+    def __init__(self, model_name, urls, strategy='least_outstanding', alpha=0.3, max_failures=3,
+                 eject_seconds=30, probe_timeout=3):
+        self.model_name = model_name
+        self.backends = [LLMBackend(url) for url in dict.fromkeys(urls)]
+        self.strategy = strategy
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._probing = set()
+        self._turns = itertools.count()
+
+    def choose(self, exclude=()):
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend not in exclude] or self.backends
+            healthy = [backend for backend in candidates if not backend.ejected] or candidates
+            # 从轮转的起点开始取负载最小的地址，负载相同时依次落到不同地址
+            start = next(self._turns) % len(healthy)
+            return min(healthy[start:] + healthy[:start], key=self._load)
+
+    def transport(self, base_url, inner):
+        """
+        :param base_url: 对话链配置的服务地址，以它开头的请求改写到选出的地址
+        :param inner: 实际发送请求的 httpx.HTTPTransport
+        """
+        return BalancedTransport(self, base_url, inner)
+
+    def async_transport(self, base_url, inner):
+        return AsyncBalancedTransport(self, base_url, inner)
+
+    def stats(self):
+        with self._lock:
+            return {backend.url: backend.stats() for backend in self.backends}
+
+    def _begin(self, backend):
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+        return time.monotonic()
+
+    def _load(self, backend):
+        if self.strategy == 'ewma':
+            # 没有耗时记录的地址优先尝试
+            return (backend.outstanding + 1) * (backend.latency or 0.0)
+        return backend.outstanding
+
+    def _record(self, backend, duration, failed=True):
+        with self._lock:
+            backend.outstanding -= 1
+            if duration is None and not failed:
+                return
+            if duration is not None:
+                backend.consecutive_failures = 0
+                backend.latency = (
+                    duration if backend.latency is None
+                    else self.alpha * duration + (1 - self.alpha) * backend.latency
+                )
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures < self.max_failures or backend.ejected:
+                return
+            backend.ejected_until = time.time() + self.eject_seconds
+            logger.warning("LLM backend %s of %s ejected", backend.url, self.model_name)
+        self._start_probe(backend)
+
+    def _start_probe(self, backend):
+        with self._lock:
+            if backend in self._probing:
+                return
+            self._probing.add(backend)
+
+        def probe():
+            try:
+                while True:
+                    time.sleep(max(backend.ejected_until - time.time(), 0))
+                    if self._probe(backend):
+                        with self._lock:
+                            backend.ejected_until = 0.0
+                            backend.consecutive_failures = 0
+                        logger.info("LLM backend %s of %s recovered", backend.url, self.model_name)
+                        return
+                    backend.ejected_until = time.time() + self.eject_seconds
+            finally:
+                with self._lock:
+                    self._probing.discard(backend)
+
+        threading.Thread(target=probe, name='llm-backend-probe', daemon=True).start()
+
+    def _probe(self, backend):
+        try:
+            response = get_http_client('probe', backend.url).get(
+                backend.url.rstrip('/') + '/models', timeout=self.probe_timeout
+            )
+            return response.status_code < 500
+        except Exception as e:
+            logger.debug("LLM backend %s probe failed: %s", backend.url, e)
+            return False
+
+
+class _RequestTracker:
+    """
+    一次经传输层发送的请求：响应体读完时记录耗时，出错或返回 5xx 时记为失败，提前关闭（取消）不计失败
+    """
+
+    def __init__(self, pool, backend):
+        self.pool = pool
+        self.backend = backend
+        self.start = pool._begin(backend)
+        self.done = False
+
+    def finish(self, failed=None):
+        """
+        :param failed: True 失败，False 取消，None 成功
+        """
+        if self.done:
+            return
+        self.done = True
+        if failed is None:
+            self.pool._record(self.backend, time.monotonic() - self.start)
+        else:
+            self.pool._record(self.backend, None, failed=failed)
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream, tracker):
+        self._stream = stream
+        self._tracker = tracker
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception:
+            self._tracker.finish(failed=True)
+            raise
+        self._tracker.finish()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._tracker.finish(failed=False)
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, tracker):
+        self._stream = stream
+        self._tracker = tracker
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception:
+            self._tracker.finish(failed=True)
+            raise
+        self._tracker.finish()
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._tracker.finish(failed=False)
+
+
+class _BalancedTransportMixin:
+    def __init__(self, pool, base_url, inner):
+        self.pool = pool
+        self.base_url = base_url.rstrip('/')
+        self.inner = inner
+
+    def _path(self, request):
+        """
+        :return: 请求地址中 base_url 之后的部分，请求不是发往 base_url 时返回None
+        """
+        url = str(request.url)
+        return url[len(self.base_url):] if url.startswith(self.base_url) else None
+
+    def _route(self, request, path, tried):
+        backend = self.pool.choose(tried)
+        request.url = httpx.URL(backend.url.rstrip('/') + path)
+        # Host 头随地址改写
+        request.headers['Host'] = request.url.netloc.decode('ascii')
+        tried.append(backend)
+        return backend
+
+    def _retry(self, tried, error):
+        # 只在连接没有建立时换一个地址重试一次，请求未发出，不会重复执行
+        if len(tried) >= 2 or len(tried) >= len(self.pool.backends):
+            return False
+        logger.warning("LLM backend %s unreachable, retrying another backend: %s", tried[-1].url, error)
+        return True
+
+
+class BalancedTransport(_BalancedTransportMixin, httpx.BaseTransport):
+    def handle_request(self, request):
+        path = self._path(request)
+        if path is None:
+            return self.inner.handle_request(request)
+        tried = []
+        while True:
+            backend = self._route(request, path, tried)
+            tracker = _RequestTracker(self.pool, backend)
+            try:
+                response = self.inner.handle_request(request)
+            except httpx.ConnectError as e:
+                tracker.finish(failed=True)
+                if self._retry(tried, e):
+                    continue
+                raise
+            except BaseException as e:
+                tracker.finish(failed=isinstance(e, Exception))
+                raise
+            if response.status_code >= 500:
+                tracker.finish(failed=True)
+                return response
+            response.stream = _TrackedStream(response.stream, tracker)
+            return response
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncBalancedTransport(_BalancedTransportMixin, httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        path = self._path(request)
+        if path is None:
+            return await self.inner.handle_async_request(request)
+        tried = []
+        while True:
+            backend = self._route(request, path, tried)
+            tracker = _RequestTracker(self.pool, backend)
+            try:
+                response = await self.inner.handle_async_request(request)
+            except httpx.ConnectError as e:
+                tracker.finish(failed=True)
+                if self._retry(tried, e):
+                    continue
+                raise
+            except BaseException as e:
+                tracker.finish(failed=isinstance(e, Exception))
+                raise
+            if response.status_code >= 500:
+                tracker.finish(failed=True)
+                return response
+            response.stream = _AsyncTrackedStream(response.stream, tracker)
+            return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_backend_pool(model_name):
+    """
+    llm_backends 配置为 {模型名称: [服务地址, ...]}，未配置的模型只使用 llm_base_url
+    """
+    pool = _pools.get(model_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(model_name)
+            if pool is None:
+                configs = SysConfig.get_config()
+                urls = (configs.get('llm_backends') or {}).get(model_name) or [configs['llm_base_url']]
+                pool = LLMBackendPool(
+                    model_name,
+                    urls,
+                    strategy=configs.get('llm_backend_strategy', 'least_outstanding'),
+                    max_failures=int(configs.get('llm_backend_max_failures', 3)),
+                    eject_seconds=float(configs.get('llm_backend_eject_seconds', 30)),
+                )
+                _pools[model_name] = pool
+    return pool
+
+
+def backend_stats():
+    return {model_name: pool.stats() for model_name, pool in list(_pools.items())}
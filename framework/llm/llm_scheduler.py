@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+# 等待时长、生成时长直方图的上界（秒）
+DURATION_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+class DurationStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = OrderedDict((bucket, 0) for bucket in DURATION_BUCKETS + ('+Inf',))
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        for bucket in self.histogram:
+            if bucket == '+Inf' or duration <= bucket:
+                self.histogram[bucket] += 1
+                break
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'histogram': {str(bucket): count for bucket, count in self.histogram.items()},
+        }
+
+
+class _Waiter:
+    def __init__(self, model, tenant):
+        self.model = model
+        self.tenant = tenant
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    LLM 请求的准入控制和公平调度（单个事件循环内使用）：
+    - 全部模型同时进行的请求不超过 llm_max_concurrency，每个模型不超过 llm_model_concurrency 中的配置
+    - 超出时进入等待队列，队列中按租户（单位或用户）轮流放行，单个租户的大量请求不会占满模型
+    - 等待的请求达到 llm_max_queue 时立即拒绝（LLMBusyError），等待超过 llm_queue_timeout 秒同样拒绝
+    - 分别统计排队等待时长和生成时长
+    """
+
+    def __init__(self):
+        self.configs = SysConfig.get_config()
+        self.max_concurrency = int(self.configs.get('llm_max_concurrency', 8))
+        self.model_concurrency = dict(self.configs.get('llm_model_concurrency') or {})
+        self.max_queue = int(self.configs.get('llm_max_queue', 64))
+        queue_timeout = self.configs.get('llm_queue_timeout')
+        self.queue_timeout = float(queue_timeout) if queue_timeout else None
+        self._active = 0
+        self._active_models = {}
+        self._queues = OrderedDict()  # 租户 -> 等待队列，按轮转顺序排列
+        self._queued = 0
+        self.rejected = 0
+        self.wait_stats = DurationStats()
+        self.generation_stats = DurationStats()
+
+    @asynccontextmanager
+    async def slot(self, model, tenant=''):
+        """
+        获取一个 LLM 调用名额，退出时释放并记录生成时长
+
+        :param model: 模型名称
+        :param tenant: 公平调度的租户，如单位编码或用户ID
+        """
+        await self.acquire(model, tenant)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.generation_stats.record(time.monotonic() - start)
+            self.release(model)
+
+    async def acquire(self, model, tenant=''):
+        if not self._queued and self._has_capacity(model):
+            self._grant(model)
+            self.wait_stats.record(0.0)
+            return
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise LLMBusyError(f"LLM queue is full ({self._queued} waiting)")
+
+        waiter = _Waiter(model, tenant)
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError, TimeoutError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已被放行但调用方不再等待，归还名额
+                self.release(model)
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise LLMBusyError(f"LLM queue wait exceeded {self.queue_timeout}s") from e
+        self.wait_stats.record(time.monotonic() - waiter.enqueued_at)
+
+    def release(self, model):
+        self._active -= 1
+        self._active_models[model] -= 1
+        self._dispatch()
+
+    def stats(self):
+        return {
+            'active': self._active,
+            'active_models': dict(self._active_models),
+            'queued': self._queued,
+            'queued_tenants': {tenant: len(queue) for tenant, queue in self._queues.items()},
+            'rejected': self.rejected,
+            'wait': self.wait_stats.stats(),
+            'generation': self.generation_stats.stats(),
+        }
+
+    def _has_capacity(self, model):
+        limit = int(self.model_concurrency.get(model, self.max_concurrency))
+        return self._active < self.max_concurrency and self._active_models.get(model, 0) < limit
+
+    def _grant(self, model):
+        self._active += 1
+        self._active_models[model] = self._active_models.get(model, 0) + 1
+
+    def _dispatch(self):
+        # 按租户轮转，每轮每个租户最多放行队首的一个请求；队首请求的模型已满时跳过该租户
+        granted = True
+        while granted and self._queues and self._active < self.max_concurrency:
+            granted = False
+            for tenant in list(self._queues):
+                queue = self._queues[tenant]
+                waiter = queue[0]
+                if not self._has_capacity(waiter.model):
+                    continue
+                queue.popleft()
+                self._queued -= 1
+                if queue:
+                    self._queues.move_to_end(tenant)
+                else:
+                    del self._queues[tenant]
+                self._grant(waiter.model)
+                waiter.future.set_result(None)
+                granted = True
+
+    def _remove(self, waiter):
+        queue = self._queues.get(waiter.tenant)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[waiter.tenant]
+            # 队首被移除后，其他等待者可能可以放行
+            self._dispatch()
+
+
+llm_scheduler = LLMScheduler()
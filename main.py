@@ -4,6 +4,7 @@ import json
 import time
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.templating import Jinja2Templates
@@ -13,18 +14,25 @@ from starlette.websockets import WebSocketDisconnect
 from websockets import ConnectionClosedOK
 
 from biz import data_filter
+from biz.answer_cache import answer_cache
 from biz.miop.auth_client import AuthClient
-from biz.chat_record_manager import ChatRecordManager
+from biz.chat_record_writer import chat_record_writer
+from biz.dqs_cache import dqs_cache
 from biz.index.dqs_client import DQSClient
 from biz.index.get_knowledge import get_org, get_index
 from biz.miop import chat_request_filter
 from biz.index.recommend import recommend_index
-from framework.algorithm.jionlp_data_collect import jio_parse_time_point, time_wash_text
 from framework.algorithm.simple_bm25 import SimpleBM25
+from framework.algorithm.time_parser import time_parser
 from framework.chain.streaming_chat_chain import StreamingChatChain
-from framework.embedding.m3e_client import m3e_client
+from framework.embedding.embedding_cache import cached_m3e_client, normalize_text
+from framework.llm.http_clients import aclose_http_clients, http_client_stats, with_http_clients
+from framework.llm.llm_backends import backend_stats, get_backend_pool
+from framework.llm.llm_scheduler import LLMBusyError, llm_scheduler
 from transport.db.neo4jdb import Neo4jDB
 from transport.websocket import websocket_sender
+from transport.websocket.coalescing_websocket import CoalescingWebSocket, websocket_stats
+from utils.async_utils import gather_blocking, run_blocking
 from utils.config_utils import SysConfig
 from utils.date_utils import cmp_current_date, parse_season
 from utils.logger_utils import LoggerFactory
@@ -47,8 +55,24 @@ dqs_client = DQSClient(configs['dqs_base_url'], configs['dqs_token'], configs['h
 
 neo4j = Neo4jDB()
 bm25 = SimpleBM25()
-chat_record = ChatRecordManager()
+# 对话记录由后台线程批量写入，不阻塞请求
+chat_record = chat_record_writer
 db_namespace = configs['neo4j_config']['namespace']
+# 检索各阶段（身份验证、时间解析、卡片、知识图谱、推荐）的超时秒数
+stage_timeout = float(configs.get('retrieve_stage_timeout', configs['websocket_timeout']))
+# 场景问题默认一次请求全部指标；dqs_scene_parallel 为 True 时按指标并发请求，
+# 进程内同时在途的DQS请求数不超过 dqs_concurrency，单个指标超时的秒数为 dqs_indicator_timeout
+dqs_scene_parallel = bool(configs.get('dqs_scene_parallel', False))
+dqs_concurrency = int(configs.get('dqs_concurrency', 4))
+dqs_indicator_timeout = float(configs.get('dqs_indicator_timeout', configs['http_timeout']))
+dqs_executor = ThreadPoolExecutor(max_workers=max(dqs_concurrency, 1), thread_name_prefix='dqs')
+# DQS缓存数据的权限范围：org 为同一单位的用户共用，user 为每个用户分别检查
+dqs_cache_scope = configs.get('dqs_cache_scope', 'org')
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_http_clients()
 
 
 @app.websocket("/chat_ws")
@@ -56,38 +80,48 @@ async def chat_ws(websocket: WebSocket):
     connection_id = str(uuid.uuid4())
     await websocket.accept()
     logger.info(f"WebSocket connection established with ID: {connection_id}")
+    # 合并发送LLM流式输出的消息帧，并统计发送量
+    websocket = CoalescingWebSocket(websocket, connection_id)
 
-    streaming_chat_chain = await StreamingChatChain.create(websocket, configs)
+    try:
+        # 每次调用大模型时在模型的多个服务地址中选择负载最低的一个
+        streaming_chat_chain = await StreamingChatChain.create(
+            websocket, with_http_clients(configs, get_backend_pool(configs['model_name']))
+        )
+        # 本连接最近几轮问答的摘要，回答缓存按对话历史区分
+        history = answer_cache.new_history()
 
-    while True:
-        try:
-            user_msg = await websocket.receive_text()
-            logger.debug("Received message from client: %s", user_msg)
+        while True:
+            try:
+                user_msg = await websocket.receive_text()
+                logger.debug("Received message from client: %s", user_msg)
 
-            await asyncio.wait_for(
-                handle_chat_interaction(websocket, user_msg, streaming_chat_chain),
-                timeout=configs['websocket_timeout'],
-            )
+                await asyncio.wait_for(
+                    handle_chat_interaction(websocket, user_msg, streaming_chat_chain, history),
+                    timeout=configs['websocket_timeout'],
+                )
 
-        except TimeoutError:
-            logger.warning("Interaction timeout")
-            await websocket_sender.send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
-            continue  # 继续监听下一个消息
-        except WebSocketDisconnect:
-            logger.info("WebSocket connection was disconnected")
-            break
-        except ConnectionClosedOK:
-            logger.info("WebSocket connection was closed properly")
-            break
-        except Exception as e:
-            logger.error("An error occurred: %s", e, exc_info=True)
-            await websocket_sender.send_msg(
-                websocket, "bot", "对不起, 出错了，请再试一次。", "error"
-            )
-            await websocket_sender.send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
+            except (TimeoutError, asyncio.TimeoutError):
+                logger.warning("Interaction timeout")
+                await websocket_sender.send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
+                continue  # 继续监听下一个消息
+            except WebSocketDisconnect:
+                logger.info("WebSocket connection was disconnected")
+                break
+            except ConnectionClosedOK:
+                logger.info("WebSocket connection was closed properly")
+                break
+            except Exception as e:
+                logger.error("An error occurred: %s", e, exc_info=True)
+                await websocket_sender.send_msg(
+                    websocket, "bot", "对不起, 出错了，请再试一次。", "error"
+                )
+                await websocket_sender.send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
+    finally:
+        websocket.release()
 
 
-async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
+async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain, history):
     logger.debug("Received message from client: %s", user_msg)
 
     msg_dict = json.loads(user_msg)
@@ -105,7 +139,7 @@ async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
 
     else:
         auth_code = msg_dict.get("token", "")
-        auth_result = auth(auth_code)
+        auth_result = await run_blocking(auth, auth_code, timeout=stage_timeout)
         if auth_result:
             org_no = auth_result['orgNo']
             user_id = auth_result['userId']
@@ -118,6 +152,8 @@ async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
     logger.info(f"Text wash: {message_content}")
 
     vector_duration = 0
+    # 卡片检索、知识图谱检索和回答缓存共用本条消息的嵌入请求
+    question_embeddings = QuestionEmbeddings()
 
     # 使用聊天请求过滤器对消息内容进行关键词过滤，并获取过滤结果
     filter_start_time = time.time()
@@ -128,44 +164,98 @@ async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
     api_code = None
     connected_sentences = []
     recommend_data = []
+    data_time = ''
+    recommend_data_tuple = None
     if filtration:
         connected_sentences = [filtration.info]
         api_code = filtration.api
     elif not filtration or filtration.mode == chat_request_filter.Modes.APPEND.value:
         logger.info("No customer 360 information found.")
         # 需要根据问题的原意解析变动的时间格式
-        data_time = parse_data_date(message_content)
-
-        # card start
-        if configs['card_enable']:
-            if cmp_current_date(data_time):
+        data_time = await run_blocking(parse_data_date, message_content, timeout=stage_timeout)
+
+        retrieve_start_time = time.time()
+        card_search = configs['card_enable'] and cmp_current_date(data_time)
+        graph_task = None
+        if card_search and configs.get('speculative_retrieve', False):
+            # 卡片检索与知识图谱检索并行，卡片命中时取消知识图谱检索，未命中时其结果已在途
+            graph_task = asyncio.create_task(
+                retrieve_graph(message_content, data_time, org_no, user_id, question_embeddings)
+            )
+            # 卡片命中时知识图谱检索的异常无需处理
+            graph_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            # card start
+            if card_search:
                 logger.info("Card search start...")
-                api_code, connected_sentences = retrieve_card(message_content, data_time, org_no)
+                try:
+                    embedding = await question_embeddings.get(message_content)
+                    api_code, connected_sentences = await run_blocking(
+                        retrieve_card, message_content, data_time, org_no, embedding, timeout=stage_timeout
+                    )
+                except asyncio.TimeoutError:
+                    # 卡片检索超时则转入知识图谱检索
+                    logger.warning("Card search timeout")
+                    api_code, connected_sentences = None, []
 
             if api_code:
                 logger.info(f"Card api code: {api_code}")
                 await websocket_sender.send_msg(websocket, "bot", api_code, "api_code")
 
-        # graph start
-        if not api_code:
-            logger.info("Card not found, start graph search...")
-            time_wash_text_message = time_wash_text(message_content)
-            retrieve_start_time = time.time()
-            connected_sentences, vector_duration, dqs_url_params, recommend_data_tuple = (
-                retrieve_index(time_wash_text_message, data_time, org_no, user_id)
-            )
-            retrieve_duration = time.time() - retrieve_start_time
-            logger.info(f"Retrieve sentences duration: {retrieve_duration}")
-            if dqs_url_params:
-                await websocket_sender.send_msg(
-                    websocket, "bot", str(dqs_url_params), "chart", dqs_url_params
+            # graph start
+            if not api_code:
+                logger.info("Card not found, start graph search...")
+                connected_sentences, vector_duration, dqs_url_params, recommend_data_tuple = (
+                    await graph_task
+                    if graph_task
+                    else await retrieve_graph(message_content, data_time, org_no, user_id, question_embeddings)
                 )
+                if dqs_url_params:
+                    await websocket_sender.send_msg(
+                        websocket, "bot", str(dqs_url_params), "chart", dqs_url_params
+                    )
+        finally:
+            if graph_task and not graph_task.done():
+                graph_task.cancel()
+        retrieve_duration = time.time() - retrieve_start_time
+        logger.info(
+            f"Retrieve sentences duration: {retrieve_duration}, speculative: {graph_task is not None}"
+        )
 
     llm_start_time = time.time()
-    if connected_sentences != '[]':
-        answer, prompt = await streaming_chat_chain.call(connected_sentences, message_content)
+    # 对话历史、检索到的数据相同且问题相同（或相近）时复用之前的回答
+    cached_answer = None
+    question_embedding = None
+    if connected_sentences != '[]' and answer_cache.enable:
+        if answer_cache.similarity > 0:
+            question_embedding = await get_question_embedding(message_content, question_embeddings)
+        cached_answer = answer_cache.get(
+            org_no, data_time, connected_sentences, message_content, question_embedding, history
+        )
+    if cached_answer:
+        answer, prompt = cached_answer
+        logger.info("Answer cache hit")
+        await replay_answer(websocket, answer)
+        # 未调用大模型，问题需要写入对话历史
+        streaming_chat_chain.add_message(message_content)
     else:
-        answer, prompt = await streaming_chat_chain.call_simple(message_content)
+        try:
+            # 模型并发受限，排队时按单位轮流调用
+            async with llm_scheduler.slot(configs['model_name'], org_no):
+                if connected_sentences != '[]':
+                    answer, prompt = await streaming_chat_chain.call(connected_sentences, message_content)
+                else:
+                    answer, prompt = await streaming_chat_chain.call_simple(message_content)
+        except LLMBusyError as e:
+            logger.warning(f"LLM busy: {e}")
+            await websocket_sender.send_msg(websocket, "bot", "当前提问人数较多，请稍后再试。", "error")
+            return
+        if connected_sentences != '[]':
+            answer_cache.put(
+                org_no, data_time, connected_sentences, message_content, answer, prompt,
+                question_embedding, history,
+            )
+    answer_cache.remember(history, message_content, answer)
     llm_duration = time.time() - llm_start_time
     logger.info(f"LLM chat duration: {llm_duration}")
     await websocket_sender.send_msg(websocket, "bot", prompt, "prompt")
@@ -173,7 +263,11 @@ async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
     # Send the end-response back to the client
     await websocket_sender.send_msg(websocket, "bot", answer, "end")
 
-    recommend_data = recommend(message_content, data_time, org_no, user_id, recommend_data_tuple)
+    if recommend_data_tuple:
+        recommend_data = await run_blocking(
+            recommend, message_content, data_time, org_no, user_id, recommend_data_tuple,
+            timeout=stage_timeout,
+        )
     if recommend_data:
         await websocket_sender.send_msg(websocket, "bot", str(recommend_data), "recommend")
 
@@ -199,8 +293,13 @@ def auth(auth_code):
 
 
 def parse_data_date(message_content):
+    # 同一问题当天只解析一次
+    return time_parser.cached('data_date', message_content, _parse_data_date)
+
+
+def _parse_data_date(message_content):
     # 需要根据问题的原意解析变动的时间格式
-    parse_data_time = jio_parse_time_point(message_content)
+    parse_data_time = time_parser.time_point(message_content)
     data_time = parse_data_time[0] if parse_data_time else None
     logger.info(f"Jio date: {data_time}")
 
@@ -216,25 +315,19 @@ def parse_data_date(message_content):
     return data_time or ''
 
 
-def retrieve_card(message_content, data_time, org_no):
-    from biz.card.card_manager import get_api_code, EmbeddingService
+def retrieve_card(message_content, data_time, org_no, embedding=None):
+    from biz.card.card_manager import EmbeddingService, card_index
 
     embedding_service = EmbeddingService()
 
+    # 向量检索、模块数据和卡片描述在一次数据库往返中取得
     vec_search_start = time.time()
-    vector_result = embedding_service.vector_search(message_content, org_no)
+    vector_result, api_code, api_desc = embedding_service.card_search(message_content, org_no, embedding)
     vec_search_duration = time.time() - vec_search_start
     logger.info(f"Card vector search duration: {vec_search_duration}")
-
-    # card key resp
-    api_code, api_desc = get_api_code(vector_result)
     connected_sentences = []
-    parse_time = jio_parse_time_point(api_desc)
-    api_date_time = (
-        parse_time[0]
-        if parse_time and parse_time[0]
-        else datetime.datetime.now().strftime("%Y%m%d")
-    )
+    # 卡片日期在加载卡片时已预先解析
+    api_date_time = card_index.desc_date(api_desc) or datetime.datetime.now().strftime("%Y%m%d")
     logger.info(f"Card api date time: {api_date_time}, date time: {data_time}")
 
     if api_code and (
@@ -250,47 +343,94 @@ def retrieve_card(message_content, data_time, org_no):
     return api_code, connected_sentences
 
 
+class QuestionEmbeddings:
+    """
+    一条消息处理过程中的嵌入请求，同一文本只请求一次，各检索分支等待同一个任务。
+    等待方被取消（如卡片命中后取消知识图谱检索）时不取消共享的任务，其他分支仍可使用其结果。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def get(self, text):
+        """
+        :return: 嵌入向量，嵌入服务无响应时返回None；超过 stage_timeout 抛出 asyncio.TimeoutError
+        """
+        key = normalize_text(text)
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cached_m3e_client.aget_embeddings(key, configs['m3e_model_name']))
+            # 所有等待方都已取消时任务的异常无需处理
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._tasks[key] = task
+        embedding_response = await asyncio.wait_for(asyncio.shield(task), timeout=stage_timeout)
+        return embedding_response['data'][0]['embedding'] if embedding_response else None
+
+
+async def get_question_embedding(message_content, question_embeddings):
+    try:
+        return await question_embeddings.get(message_content)
+    except Exception as e:
+        logger.warning(f"Failed to embed question for answer cache: {e}")
+        return None
+
+
+# 把缓存的回答按流式消息分段发送，客户端的处理与大模型输出相同
+async def replay_answer(websocket, answer):
+    chunk_size = int(configs.get('answer_cache_replay_chunk', 8))
+    for i in range(0, len(answer), chunk_size):
+        await websocket_sender.send_msg(websocket, "bot", answer[i:i + chunk_size], "stream")
+
+
+async def retrieve_graph(message_content, data_time, org_no, user_id, question_embeddings=None):
+    time_wash_text_message = await run_blocking(time_parser.wash, message_content, timeout=stage_timeout)
+    return await retrieve_index(time_wash_text_message, data_time, org_no, user_id, question_embeddings)
+
+
 # 根据对话内容，分析时间，并在知识库中分别检索供电单位、指标及其维度和纬度值，并构建DQS请求参数，获取数据并格式化返回文本
-def retrieve_index(message_content, data_time, org_no, user_id):
+async def retrieve_index(message_content, data_time, org_no, user_id, question_embeddings=None):
     _start = time.time()
     db_top = configs['top_k']
 
     # 请求嵌入文本
-    embedding_response = m3e_client.get_embeddings(message_content, configs['m3e_model_name'])
-    if embedding_response is None:
-        return "空", 0, []
-
-    embedding = embedding_response['data'][0]['embedding']
+    # 与卡片检索共用同一个嵌入请求，同一文本只请求一次嵌入服务
+    embedding = await (question_embeddings or QuestionEmbeddings()).get(message_content)
+    if embedding is None:
+        return "空", 0, None, None
 
     _time_search = time.time()
     embedding_duration = _time_search - _start
     logger.info(f"Embedding duration: {embedding_duration}")
 
-    # 原子指标检索
-    nodes_ind, scene_flag = get_index(neo4j, db_namespace, message_content, embedding, db_top)
-
-    # 检索供电单位
+    # 原子指标检索和供电单位检索互不依赖，并发执行
     _time_org = time.time()
-    org_no_query, org_name_query = get_org(neo4j, db_namespace, message_content, embedding, org_no)
+    (nodes_ind, scene_flag), (org_no_query, org_name_query) = await asyncio.gather(
+        run_blocking(get_index, neo4j, db_namespace, message_content, embedding, db_top, timeout=stage_timeout),
+        run_blocking(get_org, neo4j, db_namespace, message_content, embedding, org_no, timeout=stage_timeout),
+    )
     logger.info(f"Org result: {org_no_query} - {org_name_query}")
 
     _time_dqs = time.time()
     logger.info(f"Search org result: {org_no} -> {org_no_query}")
     logger.info(f"Search org duration: {_time_dqs - _time_org}")
     # DQS请求数据
-    # if scene_flag:
-
-    dqs_data, dqs_url_params = dqs_client.get_data_by_kg(
-        db_namespace,
-        neo4j,
-        nodes_ind[: 1 if not scene_flag else len(nodes_ind)],
-        message_content,
-        embedding,
-        org_no_query,
-        user_id,
-        data_time,
-        org_name_query,
-    )
+    if scene_flag and dqs_scene_parallel and len(nodes_ind) > 1:
+        dqs_data, dqs_url_params = await fetch_scene_data(
+            nodes_ind, message_content, embedding, org_no_query, user_id, data_time, org_name_query, org_no
+        )
+    else:
+        dqs_data, dqs_url_params = await run_blocking(
+            get_dqs_data,
+            nodes_ind[: 1 if not scene_flag else len(nodes_ind)],
+            message_content,
+            embedding,
+            org_no_query,
+            user_id,
+            data_time,
+            org_name_query,
+            org_no,
+            timeout=stage_timeout,
+        )
 
     # recommend_data = recommend_index(db_namespace, neo4j, nodes_ind[1:], message_content, embedding,
     #                                  org_name_query, org_no, user_id, data_time) if not scene_flag else None
@@ -309,6 +449,80 @@ def retrieve_index(message_content, data_time, org_no, user_id):
     return connected_sentences, embedding_duration, dqs_url_params, recommend_data_tuple
 
 
+def get_dqs_data(nodes, message_content, embedding, org_no_query, user_id, data_time, org_name_query, org_no):
+    """
+    DQS请求参数由指标、查询单位、数据日期和问题中的维度决定（问题已去掉时间词，维度在 get_data_by_kg 中按问题检索），
+    这些参数相同时不同用户复用缓存的数据。
+    DQS按用户权限过滤数据，权限单独检查：dqs_cache_scope 为 org（默认）时同一单位（org_no）的用户权限相同，
+    为 user 时每个用户分别检查
+    """
+    return dqs_cache.get_or_fetch(
+        [[str(node) for node in nodes], org_no_query, data_time, ' '.join(message_content.split())],
+        data_time,
+        lambda: dqs_client.get_data_by_kg(
+            db_namespace, neo4j, nodes, message_content, embedding, org_no_query, user_id, data_time,
+            org_name_query,
+        ),
+        scope=('user', user_id) if dqs_cache_scope == 'user' else ('org', org_no),
+    )
+
+
+async def fetch_scene_data(
+    nodes_ind, message_content, embedding, org_no_query, user_id, data_time, org_name_query, org_no
+):
+    """
+    场景问题的各个指标并发请求DQS，单个指标超时或失败时返回其余指标的数据（dqs_scene_parallel 开启时使用）。
+    dqs_client 不在本仓库中，这里依赖以下前提，接入前需按实际的 get_data_by_kg 核对：
+    - 只传一个指标时返回 (该指标的数据行列表, 该指标的图表参数或None)，多个指标一次请求的数据行等于各指标数据行依次拼接
+    - 多个指标的图表参数可按 merge_url_params 的规则合并
+    - 每个指标各自做一次维度检索，Neo4j 查询次数随指标数增加
+    """
+    results = await gather_blocking(
+        [
+            (
+                get_dqs_data,
+                ([node], message_content, embedding, org_no_query, user_id, data_time, org_name_query, org_no),
+            )
+            for node in nodes_ind
+        ],
+        dqs_executor,
+        timeout=dqs_indicator_timeout,
+    )
+    dqs_data, url_params = [], []
+    for node, result in zip(nodes_ind, results):
+        if result is None:
+            logger.warning(f"DQS data of indicator {node} is missing")
+            continue
+        dqs_data.extend(result[0])
+        if result[1]:
+            url_params.append(result[1])
+    return dqs_data, merge_url_params(url_params)
+
+
+def merge_url_params(url_params):
+    """
+    合并各指标的图表请求参数，与一次请求全部指标时得到的参数一致：
+    列表逐个合并去重（如指标列表），字典按键递归合并，其余取第一个指标的值
+    """
+    if not url_params:
+        return None
+    merged = url_params[0]
+    for params in url_params[1:]:
+        merged = _merge_params(merged, params)
+    return merged
+
+
+def _merge_params(left, right):
+    if isinstance(left, dict) and isinstance(right, dict):
+        merged = dict(left)
+        for key, value in right.items():
+            merged[key] = _merge_params(left[key], value) if key in left else value
+        return merged
+    if isinstance(left, list) and isinstance(right, list):
+        return left + [item for item in right if item not in left]
+    return left
+
+
 def recommend(message_content, data_time, org_no, user_id, recommend_data_tuple):
     nodes_ind = recommend_data_tuple[0]
     embedding = recommend_data_tuple[1]
@@ -361,7 +575,7 @@ async def test_data(data: dict):
         user_id = configs['auth_mock_user']
     else:
         auth_start_time = time.time()
-        auth_result = auth(token)
+        auth_result = await run_blocking(auth, token, timeout=stage_timeout)
         auth_duration = time.time() - auth_start_time
         logger.info(f"auth duration: {auth_duration}")
         if auth_result:
@@ -388,14 +602,21 @@ async def test_data(data: dict):
     elif not filtration or filtration.mode == chat_request_filter.Modes.APPEND.value:
         logger.info("No customer 360 information found.")
         # 需要根据问题的原意解析变动的时间格式
-        data_time = parse_data_date(message_content)
+        data_time = await run_blocking(parse_data_date, message_content, timeout=stage_timeout)
         ret_data['data_time'] = data_time
 
         # card start
         if configs['card_enable']:
             if cmp_current_date(data_time):
                 logger.info("Card search start...")
-                api_code, connected_sentences = retrieve_card(message_content, data_time, org_no)
+                try:
+                    api_code, connected_sentences = await run_blocking(
+                        retrieve_card, message_content, data_time, org_no, timeout=stage_timeout
+                    )
+                except asyncio.TimeoutError:
+                    # 卡片检索超时则转入知识图谱检索
+                    logger.warning("Card search timeout")
+                    api_code, connected_sentences = None, []
 
             if api_code:
                 logger.info(f"Card api code: {api_code}")
@@ -405,7 +626,7 @@ async def test_data(data: dict):
         if not api_code:
             logger.info("Card not found, start graph search...")
             retrieve_start_time = time.time()
-            connected_sentences, vector_duration, dqs_url_params, recommend_data = retrieve_index(
+            connected_sentences, vector_duration, dqs_url_params, recommend_data = await retrieve_index(
                 message_content, data_time, org_no, user_id
             )
             retrieve_duration = time.time() - retrieve_start_time
@@ -419,8 +640,8 @@ async def test_data(data: dict):
         llm_start_time = time.time()
         from framework.chain.chat_chain import ChatChain
 
-        chain = ChatChain(configs)
-        answer = chain.call(connected_sentences, message_content)
+        chain = ChatChain(with_http_clients(configs, get_backend_pool(configs['model_name'])))
+        answer = await run_blocking(chain.call, connected_sentences, message_content)
         llm_duration = time.time() - llm_start_time
     else:
         answer = ""
@@ -444,6 +665,46 @@ async def test_data(data: dict):
     return {"code": "200", "message": "SUCCESS", "data": ret_data}
 
 
+@app.get("/metrics/embedding")
+async def embedding_metrics():
+    from framework.embedding.embedding_batcher import m3e_batcher
+
+    return {
+        "code": "200",
+        "message": "SUCCESS",
+        "data": {"cache": cached_m3e_client.stats(), "batch": m3e_batcher.stats()},
+    }
+
+
+@app.get("/metrics/time")
+async def time_metrics():
+    return {"code": "200", "message": "SUCCESS", "data": time_parser.stats()}
+
+
+@app.get("/metrics/dqs")
+async def dqs_metrics():
+    return {"code": "200", "message": "SUCCESS", "data": dqs_cache.stats()}
+
+
+@app.get("/metrics/websocket")
+async def websocket_metrics():
+    return {"code": "200", "message": "SUCCESS", "data": websocket_stats()}
+
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    return {
+        "code": "200",
+        "message": "SUCCESS",
+        "data": {"scheduler": llm_scheduler.stats(), "backends": backend_stats(), "http": http_client_stats()},
+    }
+
+
+@app.get("/metrics/answer")
+async def answer_metrics():
+    return {"code": "200", "message": "SUCCESS", "data": answer_cache.stats()}
+
+
 @app.post("/graph/import/pg")
 async def graph_import_pg(data: dict):
     password = data['password']
@@ -456,6 +717,17 @@ async def graph_import_pg(data: dict):
     return {"code": "200", "message": "SUCCESS", "data": result}
 
 
+@app.post("/card/reload")
+async def card_reload(data: dict):
+    password = data['password']
+    if password != configs['neo4j_config']["password"]:
+        return {"code": "200", "message": "password error", "data": ""}
+    from biz.card.card_manager import card_index
+
+    result = card_index.reload()
+    return {"code": "200", "message": "SUCCESS", "data": result}
+
+
 @app.post("/graph/import/ora")
 async def graph_import_ora(data: dict):
     password = data['password']
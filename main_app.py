@@ -5,15 +5,11 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+from biz.menu.menu_retriever import MenuRetriever
 from framework.chain.chat_chain import ChatChain
 from utils.config_utils import SysConfig
 from utils.logger_utils import LoggerFactory
 
-import sqlite3
-
-import faiss
-from sentence_transformers import SentenceTransformer
-
 os.environ["RUN_ENV"] = "app"
 os.environ["DASHSCOPE_API_KEY"] = "sk-2442409327df44a394fd9ed8676d3503"
 
@@ -30,6 +26,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 模型和索引常驻内存，索引文件更新后自动替换
+menu_retriever = MenuRetriever(
+    configs['m3e_small_path'],
+    configs['menu_vectors_path'],
+    configs['database_path'],
+    mmap=configs.get('menu_index_mmap', False),
+    check_interval=float(configs.get('menu_index_check_interval', 10)),
+)
+
+
+@app.on_event("startup")
+def load_menu_retriever():
+    menu_retriever.load()
+
 
 class UserInput(BaseModel):
     prompt_text: str
@@ -59,30 +69,8 @@ async def menu(user_input: UserInput):
 
 
 def perform(search_text):
-    model = SentenceTransformer(configs['m3e_small_path'])
-
-    # 加载 Faiss 索引
-    index = faiss.read_index(configs['menu_vectors_path'])
-
-    # 连接到 SQLite 数据库
-    conn = sqlite3.connect(configs['database_path'])
-    cursor = conn.cursor()
-
-    # 将搜索文本转换为向量
-    search_vector = model.encode([search_text]).astype('float32')
-
-    # 使用 Faiss 执行搜索
     k = 3  # 我们希望返回最接近的 k 个结果
-    D, I = index.search(search_vector, k)  # D 是距离数组，I 是相应的索引 ID
-
-    # 提取与搜索查询最相关的向量 ID
-    vector_ids = I[0]
-
-    # 用这些向量 ID 从 SQLite 数据库中检索相关信息
-    vector_ids_str = ', '.join(str(id) for id in vector_ids)
-    query = f'SELECT * FROM menu_index WHERE vector_id IN ({vector_ids_str})'
-    cursor.execute(query)
-    search_results = cursor.fetchall()
+    search_results = menu_retriever.search(search_text, k)
 
     # 格式化为 Markdown 表格
     headers = ["产品编号", "产品名称", "产品目录项"]
@@ -95,8 +83,6 @@ def perform(search_text):
         for row in search_results
     ]
     markdown_results = json.dumps(results_list, cls=MarkdownTableEncoder)
-    cursor.close()
-    conn.close()
     return markdown_results
 
 
@@ -18,70 +18,86 @@ from starlette.websockets import WebSocketDisconnect
 from websockets import ConnectionClosedOK
 
 from biz.tools import RTN_TYPE, tool_manager
-from biz.chat_record_manager import ChatRecordManager
+from biz.chat_record_writer import chat_record_writer
 from framework.chain.streaming_chat_chain import StreamingChatChain
+from framework.llm.http_clients import aclose_http_clients, with_http_clients
+from framework.llm.llm_scheduler import LLMBusyError, llm_scheduler
 from transport.web_container.fastapi_base import create_base_fastapi
+from transport.websocket.coalescing_websocket import CoalescingWebSocket
 from transport.websocket.websocket_sender import send_msg
 from utils.logger_utils import LoggerFactory
 
 logger = LoggerFactory.get_logger(__name__)
-chat_record = ChatRecordManager()
+# 对话记录由后台线程批量写入，不阻塞请求
+chat_record = chat_record_writer
 app = create_base_fastapi()
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_http_clients()
+
+
 @app.websocket("/chat_ws")
 async def chat_ws(websocket: WebSocket):
     connection_id = get_uuid()
     await websocket.accept()
+    # 合并发送LLM流式输出的消息帧，并统计发送量
+    websocket = CoalescingWebSocket(websocket, connection_id)
+
+    try:
+        logger.info(f"[{connection_id}]connection established")
+        streaming_chat_chain = None
+        while True:
+            try:
+                if websocket.application_state == WebSocketState.DISCONNECTED:
+                    logger.info(f"[{connection_id}]connection was disconnected")
+                    break
+
+                user_msg = await websocket.receive_text()
+                logger.info(f"[{connection_id}]client message: %s", user_msg)
+
+                if not streaming_chat_chain:
+                    msg_dict = json.loads(user_msg)
+                    chat_config = msg_dict.get("chat_config", {})
+                    # 创建StreamingChatChain实例，加载配置
+                    streaming_chat_chain = await StreamingChatChain.create(
+                        websocket,
+                        with_http_clients(
+                            {
+                                **CONFIG,
+                                **chat_config,
+                                'user_id': msg_dict.get("user_id", ""),
+                                'org_no': msg_dict.get("org_no", ""),
+                                'connection_id': connection_id,
+                            }
+                        ),
+                    )
+                    # 设置tool
+                    logger.info(f"StreamingChatChain created: {streaming_chat_chain.configs}")
+
+                await asyncio.wait_for(
+                    handle_chat_interaction(websocket, user_msg, streaming_chat_chain),
+                    timeout=streaming_chat_chain.configs['websocket_timeout'],
+                )
 
-    logger.info(f"[{connection_id}]connection established")
-    streaming_chat_chain = None
-    while True:
-        try:
-            if websocket.application_state == WebSocketState.DISCONNECTED:
+            except TimeoutError:
+                logger.warning(f"[{connection_id}]Interaction timeout")
+                await send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
+                continue  # 继续监听下一个消息
+            except WebSocketDisconnect:
                 logger.info(f"[{connection_id}]connection was disconnected")
                 break
-
-            user_msg = await websocket.receive_text()
-            logger.info(f"[{connection_id}]client message: %s", user_msg)
-
-            if not streaming_chat_chain:
-                msg_dict = json.loads(user_msg)
-                chat_config = msg_dict.get("chat_config", {})
-                # 创建StreamingChatChain实例，加载配置
-                streaming_chat_chain = await StreamingChatChain.create(
-                    websocket,
-                    {
-                        **CONFIG,
-                        **chat_config,
-                        'user_id': msg_dict.get("user_id", ""),
-                        'org_no': msg_dict.get("org_no", ""),
-                        'connection_id': connection_id,
-                    },
-                )
-                # 设置tool
-                logger.info(f"StreamingChatChain created: {streaming_chat_chain.configs}")
-
-            await asyncio.wait_for(
-                handle_chat_interaction(websocket, user_msg, streaming_chat_chain),
-                timeout=streaming_chat_chain.configs['websocket_timeout'],
-            )
-
-        except TimeoutError:
-            logger.warning(f"[{connection_id}]Interaction timeout")
-            await send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
-            continue  # 继续监听下一个消息
-        except WebSocketDisconnect:
-            logger.info(f"[{connection_id}]connection was disconnected")
-            break
-        except ConnectionClosedOK:
-            logger.info(f"[{connection_id}]connection was closed properly")
-            break
-        except Exception as e:
-            logger.error(f"[{connection_id}]An error occurred: %s", e, exc_info=True)
-            await send_msg(websocket, "bot", "对不起, 出错了，请再试一次。", "error")
-            await send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
-    streaming_chat_chain = None
+            except ConnectionClosedOK:
+                logger.info(f"[{connection_id}]connection was closed properly")
+                break
+            except Exception as e:
+                logger.error(f"[{connection_id}]An error occurred: %s", e, exc_info=True)
+                await send_msg(websocket, "bot", "对不起, 出错了，请再试一次。", "error")
+                await send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
+        streaming_chat_chain = None
+    finally:
+        websocket.release()
 
 
 user_msg_temp = {
@@ -126,6 +142,11 @@ async def handle_chat_interaction(
 
     # 通过llm获取回答
     time_begin = time.time()
+    # 模型并发受限，排队时按单位（没有单位时按用户）轮流调用
+    llm_slot = llm_scheduler.slot(
+        chat_chain.configs.get('model_name', ''),
+        chat_chain.configs.get('org_no') or chat_chain.configs.get('user_id', ''),
+    )
     if knowledges:
         for kv, kt in [(k.value, k.type) for k in knowledges if k.type != RTN_TYPE.KNOWLEDGE]:
             await send_msg(websocket, "bot", "", kt, kv)
@@ -133,12 +154,24 @@ async def handle_chat_interaction(
         answer = ""
         prompts = [k.value for k in knowledges if k.type == RTN_TYPE.KNOWLEDGE]
         if prompts:
-            answer, prompt = await chat_chain.call(',\n'.join(prompts), message_content)
+            try:
+                async with llm_slot:
+                    answer, prompt = await chat_chain.call(',\n'.join(prompts), message_content)
+            except LLMBusyError as e:
+                logger.warning(f"[{connection_id}]LLM busy: {e}")
+                await send_msg(websocket, "bot", "当前提问人数较多，请稍后再试。", "error")
+                return
         else:
             chat_chain.add_message(message_content)
     else:
         if chat_chain.configs.get("allows_answer", False):
-            answer, prompt = await chat_chain.call_simple(message_content)
+            try:
+                async with llm_slot:
+                    answer, prompt = await chat_chain.call_simple(message_content)
+            except LLMBusyError as e:
+                logger.warning(f"[{connection_id}]LLM busy: {e}")
+                await send_msg(websocket, "bot", "当前提问人数较多，请稍后再试。", "error")
+                return
             await send_msg(websocket, "bot", prompt, "prompt")
         else:
             answer = "抱歉，您输入的内容在我的知识体系与检索范围内未找到匹配项，无法解答。"
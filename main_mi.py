@@ -17,7 +17,10 @@ from biz.fk_assistant.tools.reconnection_process_controller import ReconnectionP
 from biz.fk_assistant.tools.sms_delivery import SmsDelivery
 from framework.algorithm.simple_bm25 import SimpleBM25
 from framework.chain.streaming_chat_chain import StreamingChatChain
+from framework.llm.http_clients import aclose_http_clients, with_http_clients
+from framework.llm.llm_scheduler import LLMBusyError, llm_scheduler
 from transport.websocket import websocket_sender
+from transport.websocket.coalescing_websocket import CoalescingWebSocket
 from utils.config_utils import SysConfig
 from utils.logger_utils import LoggerFactory
 
@@ -49,40 +52,50 @@ tools = [
 tool_docs = [(tool.name, tool) for tool in tools]
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_http_clients()
+
+
 @app.websocket("/mi_chat_ws")
 async def chat_ws(websocket: WebSocket):
     connection_id = str(uuid.uuid4())
     await websocket.accept()
     logger.info(f"WebSocket connection established with ID: {connection_id}")
-
-    streaming_chat_chain = await StreamingChatChain.create(websocket, configs)
-
-    while True:
-        try:
-            user_msg = await websocket.receive_text()
-            logger.debug("Received message from client: %s", user_msg)
-
-            await asyncio.wait_for(
-                handle_chat_interaction(websocket, user_msg, streaming_chat_chain),
-                timeout=configs['websocket_timeout'],
-            )
-
-        except TimeoutError:
-            logger.warning("Interaction timeout")
-            await websocket_sender.send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
-            continue  # 继续监听下一个消息
-        except WebSocketDisconnect:
-            logger.info("WebSocket connection was disconnected")
-            break
-        except ConnectionClosedOK:
-            logger.info("WebSocket connection was closed properly")
-            break
-        except Exception as e:
-            logger.error("An error occurred: %s", e, exc_info=True)
-            await websocket_sender.send_msg(
-                websocket, "bot", "对不起, 出错了，请再试一次。", "error"
-            )
-            await websocket_sender.send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
+    # 合并发送LLM流式输出的消息帧，并统计发送量
+    websocket = CoalescingWebSocket(websocket, connection_id)
+
+    try:
+        streaming_chat_chain = await StreamingChatChain.create(websocket, with_http_clients(configs))
+
+        while True:
+            try:
+                user_msg = await websocket.receive_text()
+                logger.debug("Received message from client: %s", user_msg)
+
+                await asyncio.wait_for(
+                    handle_chat_interaction(websocket, user_msg, streaming_chat_chain),
+                    timeout=configs['websocket_timeout'],
+                )
+
+            except TimeoutError:
+                logger.warning("Interaction timeout")
+                await websocket_sender.send_msg(websocket, "bot", "请求超时，请稍后再试。", "error")
+                continue  # 继续监听下一个消息
+            except WebSocketDisconnect:
+                logger.info("WebSocket connection was disconnected")
+                break
+            except ConnectionClosedOK:
+                logger.info("WebSocket connection was closed properly")
+                break
+            except Exception as e:
+                logger.error("An error occurred: %s", e, exc_info=True)
+                await websocket_sender.send_msg(
+                    websocket, "bot", "对不起, 出错了，请再试一次。", "error"
+                )
+                await websocket_sender.send_msg(websocket, "bot", traceback.format_exc(), "error_trace")
+    finally:
+        websocket.release()
 
 
 async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
@@ -95,11 +108,20 @@ async def handle_chat_interaction(websocket, user_msg, streaming_chat_chain):
 
     docs = bm25.query(tool_docs, user_msg, num_best=1, field=0)
     if docs:
+        # 工具调用不占用模型并发
         tool_doc = json.loads(await docs[0][1]._arun("cons_no"))
         await websocket_sender.send_msg(websocket, "bot", f'${tool_doc["key"]}$', "stream")
-        answer = await streaming_chat_chain.call(tool_doc['result'], user_msg)
-    else:
-        answer = await streaming_chat_chain.call_simple(user_msg)
+    try:
+        # 模型并发受限，排队时按连接轮流调用
+        async with llm_scheduler.slot(configs['model_name'], str(id(websocket))):
+            if docs:
+                answer = await streaming_chat_chain.call(tool_doc['result'], user_msg)
+            else:
+                answer = await streaming_chat_chain.call_simple(user_msg)
+    except LLMBusyError as e:
+        logger.warning(f"LLM busy: {e}")
+        await websocket_sender.send_msg(websocket, "bot", "当前提问人数较多，请稍后再试。", "error")
+        return
 
     # Send the end-response back to the client
     await websocket_sender.send_msg(websocket, "bot", answer[0], "end")
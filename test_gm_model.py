@@ -1,8 +1,7 @@
 import asyncio
 import os
 
-import httpx
-
+from framework.llm.http_clients import get_http_client
 from framework.llm.llm_manager import achat, chat
 from utils.logger_utils import LoggerFactory
 
@@ -35,7 +34,7 @@ def gm_connect_test():
         "messages": [{"role": "user", "content": "你好"}],
         "stream": CONFIG['streaming'],
     }
-    client = httpx.Client()
+    client = get_http_client('guangming', CONFIG['llm_base_url'])
     response = client.post(CONFIG['llm_base_url'], headers=headers, json=data)
     response.raise_for_status()
     logger.info(f"llm response: {response.json()}")
@@ -0,0 +1,56 @@
+import pytest
+
+from framework.algorithm.bm25_index import BM25Index
+
+CARDS = [
+    (1, '本月售电量是多少'),
+    (2, '上月售电量同比增长情况'),
+    (3, '今年累计售电量及完成率'),
+    (4, '供电单位线损率排名'),
+    (5, '本月线损率'),
+    (6, '上月电费回收率'),
+    (7, '居民用户数量统计'),
+    (8, '高压用户新装增容情况'),
+    (9, '电费回收率同比'),
+    (10, '本年度居民售电量'),
+]
+
+QUESTIONS = [
+    '上月售电量',
+    '本月线损率是多少',
+    '电费回收情况',
+    '居民用户有多少',
+    '今年高压新装',
+    '天气怎么样',
+]
+
+
+@pytest.mark.parametrize('question', QUESTIONS)
+@pytest.mark.parametrize('top_k', [1, 3, 5])
+def test_same_candidates_as_simple_bm25(question, top_k):
+    simple_bm25 = pytest.importorskip('framework.algorithm.simple_bm25')
+    # EmbeddingService 原来的调用方式：query(全部卡片, 问题, top_k, 1)
+    expected = simple_bm25.SimpleBM25().query(CARDS, question, top_k, 1)
+    index = BM25Index()
+    index.build(CARDS)
+    assert [vector_id for vector_id, _ in index.query(question, top_k)] == [row[0] for row in expected]
+
+
+@pytest.mark.parametrize('question', QUESTIONS)
+def test_incremental_add_matches_build(question):
+    built = BM25Index()
+    built.build(CARDS)
+    added = BM25Index()
+    added.build(CARDS[:4])
+    added.add(CARDS[4:])
+    assert added.query(question, 5) == built.query(question, 5)
+
+
+def test_remove_matches_build():
+    built = BM25Index()
+    built.build(CARDS[:-2])
+    removed = BM25Index()
+    removed.build(CARDS)
+    removed.remove([9, 10])
+    for question in QUESTIONS:
+        assert removed.query(question, 5) == built.query(question, 5)
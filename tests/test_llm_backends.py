@@ -0,0 +1,85 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+uvicorn = pytest.importorskip('uvicorn')
+fake_openai_server = pytest.importorskip('framework.llm.fake_openai_server')
+
+from framework.llm.llm_backends import LLMBackendPool  # noqa: E402
+
+BASE_URL = 'http://llm.local/v1'
+REQUEST = {'model': 'fake-model', 'messages': [{'role': 'user', 'content': '你好'}]}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def fake_urls():
+    fake_openai_server.settings.update(first_token_delay=0.0, delay=0.0, fail_rate=0.0)
+    servers = []
+    for _ in range(2):
+        server = uvicorn.Server(uvicorn.Config(fake_openai_server.app, port=_free_port(), log_level='error'))
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+    deadline = time.time() + 10
+    while not all(server.started for server in servers):
+        assert time.time() < deadline, 'fake openai server did not start'
+        time.sleep(0.05)
+    yield [f'http://127.0.0.1:{server.config.port}/v1' for server in servers]
+    for server in servers:
+        server.should_exit = True
+
+
+def _client(pool):
+    return httpx.Client(transport=pool.transport(BASE_URL, httpx.HTTPTransport()))
+
+
+def test_least_outstanding_alternates_when_idle(fake_urls):
+    pool = LLMBackendPool('fake-model', fake_urls)
+    with _client(pool) as client:
+        for _ in range(4):
+            response = client.post(BASE_URL + '/chat/completions', json=REQUEST)
+            assert response.status_code == 200
+    assert [stats['requests'] for stats in pool.stats().values()] == [2, 2]
+    assert all(stats['outstanding'] == 0 for stats in pool.stats().values())
+
+
+def test_unreachable_backend_retries_another(fake_urls):
+    dead_url = f'http://127.0.0.1:{_free_port()}/v1'
+    pool = LLMBackendPool('fake-model', [dead_url, fake_urls[0]], max_failures=100)
+    with _client(pool) as client:
+        for _ in range(4):
+            assert client.post(BASE_URL + '/chat/completions', json=REQUEST).status_code == 200
+    stats = pool.stats()
+    assert stats[fake_urls[0]]['requests'] == 4
+    assert stats[dead_url]['failures'] == stats[dead_url]['requests'] > 0
+
+
+@pytest.mark.parametrize('strategy', ['least_outstanding', 'ewma'])
+def test_concurrent_streams_spread_across_backends(fake_urls, strategy):
+    # ewma 下两个地址都还没有耗时记录，同时发出的请求不能都落到第一个地址
+    pool = LLMBackendPool('fake-model', fake_urls, strategy=strategy)
+
+    async def stream_once(client):
+        async with client.stream('POST', BASE_URL + '/chat/completions', json={**REQUEST, 'stream': True}) as response:
+            assert response.status_code == 200
+            return [line async for line in response.aiter_lines() if line.startswith('data: ')]
+
+    async def run():
+        transport = pool.async_transport(BASE_URL, httpx.AsyncHTTPTransport())
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await asyncio.gather(*(stream_once(client) for _ in range(4)))
+
+    for lines in asyncio.run(run()):
+        assert lines[-1] == 'data: [DONE]'
+    stats = pool.stats()
+    assert all(backend['requests'] > 0 for backend in stats.values())
+    assert all(backend['outstanding'] == 0 and backend['latency'] is not None for backend in stats.values())
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Union
+from collections import namedtuple
+from typing import Iterator, Union
 
 from utils.config_utils import SysConfig
 from utils.encryptor_utils import SimpleEncryptor
@@ -27,3 +28,22 @@ class BaseDB(ABC):
     @abstractmethod
     def execute_batch(self, commands: list[(str, Union[list, tuple, dict])]):
         pass
+
+    def execute_many(self, statement: str, parameters_list: list[Union[list, tuple, dict]]):
+        """
+        同一语句绑定多组参数执行（Oracle 为数组DML），子类可以用 cursor.executemany 覆盖
+        """
+        return self.execute_batch([(statement, parameters) for parameters in parameters_list])
+
+    def query_stream(self, statement: str, parameters: Union[list, tuple, dict] = None) -> Iterator[tuple]:
+        """
+        逐行返回查询结果，行为以小写列名为字段的 namedtuple。
+        结果仍由 query 一次取回，调用方应逐行处理、不再另外构造字典列表，避免同一结果集在内存中保留两份。
+
+        :return: 行迭代器
+        """
+        row_type = None
+        for result in self.query(statement, parameters):
+            if row_type is None:
+                row_type = namedtuple('Row', [str(key).lower() for key in result], rename=True)
+            yield row_type(*result.values())
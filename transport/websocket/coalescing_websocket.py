@@ -0,0 +1,201 @@
+import asyncio
+import json
+import time
+import weakref
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+# 已关闭连接的累计发送量，活动连接的发送量从 _connections 中实时汇总
+_closed_totals = {'connections': 0, 'frames_in': 0, 'frames_out': 0, 'bytes_out': 0}
+_connections = weakref.WeakSet()
+
+
+class CoalescingWebSocket:
+    """
+    包装 WebSocket 连接，合并发送 stream 类型的消息帧：
+    连续的、除消息内容外其他字段都相同的 stream 帧先缓存，内容拼接后作为一帧发送，
+    在缓存内容达到 ws_coalesce_max_bytes 字节、缓存超过 ws_coalesce_window_ms 毫秒或发送其他类型的消息前发送。
+    其他消息（start、end、error 等）原样按顺序发送，消息格式不变；无法识别的帧也原样发送。
+    send_bytes、send 等其他发送方法先发送缓存的内容，保证各帧的顺序与调用顺序一致。
+    ws_coalesce_enable 为 False 时不合并，只统计每个连接的发送帧数和字节数。
+    """
+
+    def __init__(self, websocket, connection_id=''):
+        self._websocket = websocket
+        self.connection_id = connection_id
+        configs = SysConfig.get_config()
+        self.enable = bool(configs.get('ws_coalesce_enable', False))
+        self.window = float(configs.get('ws_coalesce_window_ms', 30)) / 1000
+        self.max_bytes = int(configs.get('ws_coalesce_max_bytes', 1024))
+        self.type_key = configs.get('ws_coalesce_type_key', 'type')
+        self.message_key = configs.get('ws_coalesce_message_key', 'message')
+        self._buffer = None  # (帧字典, 是否通过 send_json 发送)
+        self._buffer_bytes = 0
+        self._timer = None
+        self._timer_task = None
+        self._lock = asyncio.Lock()
+        self.started = time.monotonic()
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        _connections.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._websocket, name)
+
+    async def send_text(self, data):
+        await self._send(data, False)
+
+    async def send_json(self, data, mode='text'):
+        if mode != 'text':
+            async with self._lock:
+                self.frames_in += 1
+                await self._flush()
+                await self._write(data, True, mode)
+            return
+        await self._send(data, True)
+
+    async def send_bytes(self, data):
+        async with self._lock:
+            self.frames_in += 1
+            await self._flush()
+            await self._websocket.send_bytes(data)
+            self.frames_out += 1
+            self.bytes_out += len(data)
+
+    async def send(self, message):
+        """
+        发送原始的 ASGI 消息
+        """
+        async with self._lock:
+            await self._flush()
+            await self._websocket.send(message)
+            if message.get('type') == 'websocket.send':
+                data = message.get('bytes') or (message.get('text') or '').encode('utf-8')
+                self.frames_in += 1
+                self.frames_out += 1
+                self.bytes_out += len(data)
+
+    async def flush(self):
+        async with self._lock:
+            await self._flush()
+
+    async def close(self, *args, **kwargs):
+        await self.flush()
+        await self._websocket.close(*args, **kwargs)
+
+    def release(self):
+        """
+        连接结束时调用，把本连接的发送量计入累计值；连接已断开，未发送的缓存直接丢弃
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer = None
+        if self in _connections:
+            _connections.discard(self)
+            _closed_totals['connections'] += 1
+            for key in ('frames_in', 'frames_out', 'bytes_out'):
+                _closed_totals[key] += getattr(self, key)
+            logger.info("WebSocket %s send stats: %s", self.connection_id, self.stats())
+
+    def stats(self):
+        duration = max(time.monotonic() - self.started, 1e-6)
+        return {
+            'frames_in': self.frames_in,
+            'frames_out': self.frames_out,
+            'bytes_out': self.bytes_out,
+            'frames_per_sec': self.frames_out / duration,
+            'bytes_per_sec': self.bytes_out / duration,
+        }
+
+    async def _send(self, data, as_json):
+        async with self._lock:
+            self.frames_in += 1
+            frame = self._stream_frame(data, as_json) if self.enable else None
+            if frame is None:
+                await self._flush()
+                await self._write(data, as_json)
+                return
+
+            message = frame[self.message_key]
+            if self._buffer is not None and self._mergeable(frame, as_json):
+                self._buffer[0][self.message_key] += message
+            else:
+                await self._flush()
+                self._buffer = (frame, as_json)
+                self._buffer_bytes = 0
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+            self._buffer_bytes += len(message.encode('utf-8'))
+            if self._buffer_bytes >= self.max_bytes:
+                await self._flush()
+
+    def _on_timer(self):
+        # 保留任务的引用，避免任务未完成时被回收
+        self._timer_task = asyncio.ensure_future(self._timer_flush())
+
+    async def _timer_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            # 定时发送不在调用方的调用链中，异常在这里记录；连接断开后由接收循环处理
+            logger.warning("WebSocket %s failed to flush coalesced frames: %s", self.connection_id, e)
+
+    def _stream_frame(self, data, as_json):
+        if not as_json:
+            try:
+                data = json.loads(data)
+            except (TypeError, ValueError):
+                return None
+        if (
+            isinstance(data, dict)
+            and data.get(self.type_key) == 'stream'
+            and isinstance(data.get(self.message_key), str)
+        ):
+            return dict(data)
+        return None
+
+    def _mergeable(self, frame, as_json):
+        buffered, buffered_as_json = self._buffer
+        return buffered_as_json == as_json and all(
+            buffered.get(key) == value for key, value in frame.items() if key != self.message_key
+        ) and buffered.keys() == frame.keys()
+
+    async def _flush(self):
+        # 调用方持有锁
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer is None:
+            return
+        frame, as_json = self._buffer
+        self._buffer = None
+        await self._write(frame if as_json else json.dumps(frame, ensure_ascii=False), as_json)
+
+    async def _write(self, data, as_json, mode='text'):
+        if as_json:
+            # 与 Starlette 的 send_json 编码方式相同，只序列化一次，发送的内容同时用于统计字节数
+            data = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        payload = data.encode('utf-8')
+        if mode == 'binary':
+            await self._websocket.send_bytes(payload)
+        else:
+            await self._websocket.send_text(data)
+        self.frames_out += 1
+        self.bytes_out += len(payload)
+
+
+def websocket_stats():
+    """
+    :return: 累计发送量和各活动连接的发送速率
+    """
+    active = {connection.connection_id: connection.stats() for connection in list(_connections)}
+    totals = dict(_closed_totals)
+    for stats in active.values():
+        for key in ('frames_in', 'frames_out', 'bytes_out'):
+            totals[key] += stats[key]
+    totals['active'] = len(active)
+    return {'totals': totals, 'connections': active}
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config_utils import SysConfig
+from utils.logger_utils import LoggerFactory
+
+logger = LoggerFactory.get_logger(__name__)
+
+_configs = SysConfig.get_config()
+
+# 阻塞调用（HTTP、数据库、CPU密集的解析）使用的有界线程池，避免阻塞事件循环
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(_configs.get('blocking_workers', 32)), thread_name_prefix='blocking'
+)
+
+
+async def run_blocking(func, *args, timeout=None, **kwargs):
+    """
+    在线程池中执行阻塞调用并等待结果
+
+    :param func: 阻塞函数
+    :param timeout: 超时秒数，超时抛出 asyncio.TimeoutError；外层任务被取消时不再等待结果
+    :return: 函数返回值
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout=timeout)
+
+
+async def gather_blocking(calls, executor, timeout=None):
+    """
+    在指定线程池中并发执行多个阻塞调用；单个调用超时或出错时其结果为 None，不影响其他调用。
+    超时的调用如果还在排队则不再执行，已开始的调用会继续占用线程直到返回，
+    因此同时执行的调用数始终不超过线程池的线程数（超时时间包括排队时间）。
+
+    :param calls: [(func, args), ...]
+    :param executor: 执行调用的有界线程池
+    :param timeout: 单个调用的超时秒数
+    :return: 与 calls 顺序一致的结果列表
+    """
+    loop = asyncio.get_running_loop()
+
+    async def call(func, args):
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, functools.partial(func, *args)), timeout)
+        except (TimeoutError, asyncio.TimeoutError):
+            logger.warning("Blocking call %s timed out after %ss", getattr(func, '__name__', func), timeout)
+        except Exception as e:
+            logger.error("Blocking call %s failed: %s", getattr(func, '__name__', func), e, exc_info=True)
+        return None
+
+    return await asyncio.gather(*(call(func, args) for func, args in calls))